@@ -0,0 +1 @@
+"""Django Mail Factory benchmarks."""
@@ -0,0 +1,56 @@
+"""Compare the EmailMultiRelated cid substitution to one re.sub per image.
+
+Run from the repository root::
+
+    python -m benchmarks.cid_substitution
+
+"""
+
+import os
+import re
+import timeit
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "demo.settings")
+django.setup()
+
+from mail_factory.messages import add_cid, get_filenames_pattern  # noqa: E402
+
+
+def substitute_each(content, filenames):
+    """The previous implementation: one pattern and one scan per image."""
+    for filename in filenames:
+        content = re.sub(
+            r"(?<!cid:)%s" % re.escape(filename), "cid:%s" % filename, content
+        )
+    return content
+
+
+def substitute_once(content, filenames):
+    """EmailMultiRelated._create_alternatives: a single cached pattern."""
+    return get_filenames_pattern(filenames).sub(add_cid, content)
+
+
+def build_html(filenames, paragraphs=200):
+    images = "".join('<img src="%s" />' % filename for filename in filenames)
+    text = "<p>%s</p>" % ("Lorem ipsum dolor sit amet. " * 20)
+    return "<html><body>%s%s</body></html>" % (images, text * paragraphs)
+
+
+def main(number=200):
+    print("%8s %12s %12s %8s" % ("images", "each (ms)", "once (ms)", "speedup"))
+    for count in (1, 5, 10, 20, 50, 100):
+        filenames = ["image-%d.png" % i for i in range(count)]
+        html = build_html(filenames)
+        assert substitute_each(html, filenames) == substitute_once(html, filenames)
+        each = timeit.timeit(lambda: substitute_each(html, filenames), number=number)
+        once = timeit.timeit(lambda: substitute_once(html, filenames), number=number)
+        print(
+            "%8d %12.3f %12.3f %7.1fx"
+            % (count, each * 1000 / number, once * 1000 / number, each / once)
+        )
+
+
+if __name__ == "__main__":
+    main()
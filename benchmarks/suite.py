@@ -0,0 +1,370 @@
+"""Benchmarks of the rendering and MIME hot paths.
+
+Run from the repository root::
+
+    python -m benchmarks --output benchmarks/results.json
+    python -m benchmarks --compare benchmarks/results.json
+
+Each benchmark is measured with a baseline mail, and then with one of its
+body size, number of languages, number of inline images or attachment size
+changed. The benchmarks iterate over the languages, so their times grow with
+the number of languages.
+
+The results are written as JSON, and compared to previous results with the
+``--compare`` option, which exits with an error if a benchmark is slower than
+the threshold.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.test import RequestFactory, override_settings
+from django.urls import clear_url_caches
+
+import mail_factory
+from mail_factory import factory, views
+from mail_factory.forms import MailForm
+from mail_factory.mails import BaseMail
+
+#: The parameters of the baseline mail.
+BASELINE = {"body_size": 10000, "languages": 2, "images": 2, "attachment_size": 0}
+
+#: The values of each parameter, the others staying at the baseline.
+DIMENSIONS = {
+    "body_size": [1000, 10000, 100000],
+    "languages": [1, 2, 5],
+    "images": [0, 2, 10],
+    "attachment_size": [0, 100000, 1000000],
+}
+
+LANGUAGES = [
+    ("en", "English"),
+    ("fr", "French"),
+    ("de", "German"),
+    ("es", "Spanish"),
+    ("it", "Italian"),
+]
+
+EMAILS = ["benchmark@example.com"]
+
+ITEM = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod."
+
+SUBJECT = "{{ title }} ({{ lang }})"
+BODY_TXT = "{{ title }}\n{% for item in items %}{{ item }}\n{% endfor %}"
+BODY_HTML = (
+    "<html><body><h1>{{ title }}</h1>[images]"
+    "{% for item in items %}<p>{{ item }}</p>{% endfor %}</body></html>"
+)
+
+
+class BenchmarkMail(BaseMail):
+    template_name = "benchmark"
+    params = ["title", "items"]
+    attachments = []
+
+    def get_attachments(self, attachments=None):
+        return self.attachments
+
+
+class BenchmarkMailForm(MailForm):
+    context = {}
+
+    def get_preview_data(self, **kwargs):
+        return dict(kwargs, **self.context)
+
+
+class Fixture:
+    """Set up the templates, attachments and settings of a benchmark mail."""
+
+    def __init__(self, body_size, languages, images, attachment_size):
+        self.params = {
+            "body_size": body_size,
+            "languages": languages,
+            "images": images,
+            "attachment_size": attachment_size,
+        }
+        self.languages = [code for code, name in LANGUAGES[:languages]]
+        self.context = {
+            "title": "Benchmark",
+            "items": [ITEM] * (body_size // (len(ITEM) + 7)),
+        }
+
+    def write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb" if isinstance(content, bytes) else "w") as fd:
+            fd.write(content)
+        return path
+
+    def __enter__(self):
+        self.directory = tempfile.TemporaryDirectory()
+        root = self.directory.name
+
+        attachments = []
+        for i in range(self.params["images"]):
+            path = self.write(os.path.join(root, "image-%d.png" % i), os.urandom(8192))
+            attachments.append((path, "image-%d.png" % i, "image/png"))
+        if self.params["attachment_size"]:
+            path = os.path.join(root, "attachment.pdf")
+            self.write(path, os.urandom(self.params["attachment_size"]))
+            attachments.append((path, "attachment.pdf", "application/pdf"))
+
+        images = "".join(
+            '<img src="cid:image-%d.png" />' % i for i in range(self.params["images"])
+        )
+        for lang in self.languages:
+            templates = os.path.join(root, "templates", "mails", "benchmark", lang)
+            prefix = "{%% with lang='%s' %%}" % lang
+            self.write(
+                os.path.join(templates, "subject.txt"),
+                prefix + SUBJECT + "{% endwith %}",
+            )
+            self.write(os.path.join(templates, "body.txt"), BODY_TXT)
+            self.write(
+                os.path.join(templates, "body.html"),
+                BODY_HTML.replace("[images]", images),
+            )
+
+        engine = dict(settings.TEMPLATES[0])
+        engine["DIRS"] = [os.path.join(root, "templates")]
+        self.settings = override_settings(
+            TEMPLATES=[engine],
+            LANGUAGES=LANGUAGES[: self.params["languages"]],
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+            ALLOWED_HOSTS=["testserver"],
+            MAIL_FACTORY_PREVIEW_CACHE_TIMEOUT=0,
+        )
+        self.settings.enable()
+        # The preview urls depend on the languages.
+        importlib.reload(importlib.import_module("mail_factory.urls"))
+        clear_url_caches()
+
+        BenchmarkMail.attachments = attachments
+        BenchmarkMailForm.context = self.context
+        factory.register(BenchmarkMail, BenchmarkMailForm)
+        return self
+
+    def __exit__(self, *exc_info):
+        factory.unregister(BenchmarkMail)
+        self.settings.disable()
+        importlib.reload(importlib.import_module("mail_factory.urls"))
+        clear_url_caches()
+        self.directory.cleanup()
+
+
+def get_request():
+    from django.contrib.auth.models import User
+
+    request = RequestFactory().get("/")
+    request.user = User(username="admin", is_staff=True, is_superuser=True)
+    return request
+
+
+def bench_create_email_msg(fixture):
+    mail = BenchmarkMail(fixture.context)
+
+    def run():
+        for lang in fixture.languages:
+            mail.create_email_msg(EMAILS, lang=lang)
+
+    return run
+
+
+def bench_as_bytes(fixture):
+    mail = BenchmarkMail(fixture.context)
+    messages = [mail.create_email_msg(EMAILS, lang=lang) for lang in fixture.languages]
+
+    def run():
+        for message in messages:
+            message.message().as_bytes()
+
+    return run
+
+
+def bench_get_html_for(fixture):
+    def run():
+        for lang in fixture.languages:
+            factory.get_html_for("benchmark", fixture.context, lang, cid_to_data=True)
+
+    return run
+
+
+def bench_preview_form(fixture):
+    view = views.MailFormView.as_view()
+    request = get_request()
+
+    def run():
+        view(request, mail_name="benchmark")
+
+    return run
+
+
+def bench_preview_message(fixture):
+    view = views.MailPreviewMessageView.as_view()
+    request = get_request()
+
+    def run():
+        for lang in fixture.languages:
+            view(request, mail_name="benchmark", lang=lang)
+
+    return run
+
+
+#: The benchmarks, by name.
+BENCHMARKS = {
+    "create_email_msg": bench_create_email_msg,
+    "as_bytes": bench_as_bytes,
+    "get_html_for": bench_get_html_for,
+    "preview_form": bench_preview_form,
+    "preview_message": bench_preview_message,
+}
+
+
+def get_cases():
+    """Return the parameters of each case: the baseline, then each variation."""
+    cases = [BASELINE]
+    for name, values in DIMENSIONS.items():
+        for value in values:
+            params = dict(BASELINE, **{name: value})
+            if params not in cases:
+                cases.append(params)
+    return cases
+
+
+def get_name(benchmark, params):
+    return "%s[%s]" % (
+        benchmark,
+        ",".join("%s=%s" % (name, params[name]) for name in BASELINE),
+    )
+
+
+def measure(func, repeat):
+    """Return the min and median seconds per call, and the calls per repeat."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [time / number for time in timer.repeat(repeat, number)]
+    return min(times), statistics.median(times), number
+
+
+def run(selected=None, repeat=5, out=sys.stdout):
+    """Run the benchmarks whose name contain selected, return the results."""
+    results = {}
+    for params in get_cases():
+        names = {
+            get_name(benchmark, params): benchmark
+            for benchmark in BENCHMARKS
+            if not selected or selected in get_name(benchmark, params)
+        }
+        if not names:
+            continue
+        with Fixture(**params) as fixture:
+            for name, benchmark in names.items():
+                best, median, number = measure(BENCHMARKS[benchmark](fixture), repeat)
+                results[name] = {
+                    "benchmark": benchmark,
+                    "params": params,
+                    "min": best,
+                    "median": median,
+                    "loops": number,
+                    "repeat": repeat,
+                }
+                out.write("%-85s %10.3f ms\n" % (name, median * 1000))
+                out.flush()
+    return {
+        "meta": {
+            "mail_factory": mail_factory.get_version(),
+            "django": django.get_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.now(timezone.utc).isoformat(),
+        },
+        "benchmarks": results,
+    }
+
+
+def compare(old, new, threshold, out=sys.stdout):
+    """Print the median time ratio of each benchmark, return the regressions.
+
+    A benchmark regressed if its median time grew by more than the threshold,
+    eg: 0.1 for 10%.
+    """
+    regressions = []
+    out.write("%-85s %10s %10s %7s\n" % ("benchmark", "old (ms)", "new (ms)", "ratio"))
+    for name, result in new["benchmarks"].items():
+        if name not in old["benchmarks"]:
+            continue
+        before = old["benchmarks"][name]["median"]
+        ratio = result["median"] / before
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  slower"
+        out.write(
+            "%-85s %10.3f %10.3f %6.2fx%s\n"
+            % (name, before * 1000, result["median"] * 1000, ratio, flag)
+        )
+    return regressions
+
+
+def setup():
+    """Set up Django with the demo project settings, unless already set."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "demo.settings")
+    django.setup()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--compare",
+        nargs="+",
+        metavar="RESULTS",
+        help="Compare the results to these previous results. With two files, "
+        "compare them without running the benchmarks.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="The slowdown reported as a regression (default: 0.1, for 10%%).",
+    )
+    parser.add_argument(
+        "--filter", help="Only run the benchmarks whose name contains this."
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of measures of each benchmark (default: 5).",
+    )
+    options = parser.parse_args(argv)
+    if options.compare and len(options.compare) > 2:
+        parser.error("--compare takes one or two result files")
+
+    if options.compare and len(options.compare) == 2:
+        with open(options.compare[1]) as fd:
+            results = json.load(fd)
+    else:
+        setup()
+        results = run(options.filter, options.repeat)
+        if options.output:
+            with open(options.output, "w") as fd:
+                json.dump(results, fd, indent=2)
+
+    if options.compare:
+        with open(options.compare[0]) as fd:
+            previous = json.load(fd)
+        if compare(previous, results, options.threshold):
+            return 1
+    return 0
@@ -1,23 +1,49 @@
 """Django Mail Manager"""
 
+from importlib import import_module
+
 import django
 
-from mail_factory.app_no_autodiscover import SimpleMailFactoryConfig
-from mail_factory.apps import MailFactoryConfig
 from mail_factory.factory import MailFactory
-from mail_factory.forms import MailForm  # NOQA
-from mail_factory.mails import BaseMail  # NOQA
-
-pkg_resources = __import__("pkg_resources")
-distribution = pkg_resources.get_distribution("django-mail-factory")
-
-#: Module version, as defined in PEP-0396.
-__version__ = distribution.version
 
 __all__ = ["MailFactoryConfig", "SimpleMailFactoryConfig"]
 
 factory = MailFactory()
 
+# Imported on first access, to keep the package import cheap.
+_lazy_attributes = {
+    "BaseMail": "mail_factory.mails",
+    "MailForm": "mail_factory.forms",
+    "MailFactoryConfig": "mail_factory.apps",
+    "SimpleMailFactoryConfig": "mail_factory.app_no_autodiscover",
+}
+
+
+def get_version():
+    try:
+        from importlib.metadata import version
+    except ImportError:  # Python 3.7
+        import pkg_resources
+
+        return pkg_resources.get_distribution("django-mail-factory").version
+    return version("django-mail-factory")
+
+
+def __getattr__(name):
+    if name == "__version__":
+        #: Module version, as defined in PEP-0396.
+        value = get_version()
+    elif name in _lazy_attributes:
+        value = getattr(import_module(_lazy_attributes[name]), name)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_attributes) + ["__version__"])
+
 
 if django.VERSION[:2] < (3, 2):
     default_app_config = "mail_factory.apps.MailFactoryConfig"
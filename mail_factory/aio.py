@@ -0,0 +1,192 @@
+"""Asynchronous mail sending.
+
+With the Django SMTP backend, the messages are sent with the aiosmtplib
+non-blocking SMTP client, using the same EMAIL_* settings. The other backends
+are called in a thread.
+"""
+
+import asyncio
+import contextlib
+import weakref
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.smtp import EmailBackend as SMTPEmailBackend
+from django.core.mail.message import sanitize_address
+from django.core.mail.utils import DNS_NAME
+
+from . import exceptions, signals, throttle
+
+#: The concurrent connections semaphores, by event loop.
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_semaphore():
+    """Return the semaphore bounding the concurrent connections of the loop.
+
+    The maximum number of concurrent connections is defined by the
+    MAIL_FACTORY_ASYNC_MAX_CONNECTIONS setting, and defaults to 10.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(
+            getattr(settings, "MAIL_FACTORY_ASYNC_MAX_CONNECTIONS", 10)
+        )
+    return _semaphores[loop]
+
+
+class BackendConnection:
+    """Send the messages with a Django email backend, in a thread."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def open(self):
+        await sync_to_async(self.backend.open)()
+
+    async def close(self):
+        await sync_to_async(self.backend.close)()
+
+    async def send(self, message):
+        sender = self.backend.__class__
+        started = signals.start()
+        try:
+            await sync_to_async(self.backend.send_messages)([message])
+        except Exception as e:
+            signals.finish_message(sender, "send", started, message, e)
+            raise
+        signals.finish_message(sender, "send", started, message)
+
+
+class SMTPConnection:
+    """Send the messages with aiosmtplib, using the SMTP backend settings."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.client = None
+
+    async def open(self):
+        try:
+            import aiosmtplib
+        except ImportError:
+            raise exceptions.MailFactoryError(
+                "aiosmtplib is needed to send mails asynchronously with the SMTP "
+                "backend: pip install django-mail-factory[async]"
+            )
+
+        self.client = aiosmtplib.SMTP(
+            hostname=self.backend.host,
+            port=self.backend.port,
+            username=self.backend.username or None,
+            password=self.backend.password or None,
+            local_hostname=DNS_NAME.get_fqdn(),
+            timeout=self.backend.timeout,
+            use_tls=self.backend.use_ssl,
+            start_tls=self.backend.use_tls,
+            client_cert=self.backend.ssl_certfile,
+            client_key=self.backend.ssl_keyfile,
+        )
+        await self.client.connect()
+
+    async def close(self):
+        if self.client is not None and self.client.is_connected:
+            try:
+                await self.client.quit()
+            except Exception:
+                self.client.close()
+        self.client = None
+
+    async def send(self, message):
+        if not message.recipients():
+            return
+        if self.client is None or not self.client.is_connected:
+            # The server closed the connection since the last message.
+            await self.open()
+
+        started = signals.start()
+        encoding = message.encoding or settings.DEFAULT_CHARSET
+        from_email = sanitize_address(message.from_email, encoding)
+        recipients = [sanitize_address(addr, encoding) for addr in message.recipients()]
+        try:
+            await self.client.sendmail(
+                from_email, recipients, message.message().as_bytes(linesep="\r\n")
+            )
+        except Exception as e:
+            signals.finish_message(self.__class__, "send", started, message, e)
+            raise
+        signals.finish_message(self.__class__, "send", started, message)
+
+
+def get_async_connection():
+    """Return an asynchronous connection for the configured email backend."""
+    backend = get_connection()
+    if isinstance(backend, SMTPEmailBackend):
+        return SMTPConnection(backend)
+    return BackendConnection(backend)
+
+
+@contextlib.asynccontextmanager
+async def connection():
+    """Open an asynchronous connection, once a connection slot is free."""
+    async with get_semaphore():
+        conn = get_async_connection()
+        await conn.open()
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+
+async def send_message(message):
+    """Send a message through its own connection."""
+    async with connection() as conn:
+        await conn.send(message)
+
+
+async def send_many(build_message, recipients):
+    """Build and send a message for each (emails, context) pair of recipients.
+
+    ``build_message(emails, context)`` returns the message to send, it is
+    called in a thread so it can access the database. The messages are sent
+    through up to MAIL_FACTORY_ASYNC_MAX_CONNECTIONS concurrent connections,
+    throttled by recipient domain (see mail_factory.throttle), and a failure
+    for a recipient doesn't stop the others.
+
+    Return a list of (emails, error) tuples in the recipients order, the
+    error being None if the mail was sent, or the raised exception.
+    """
+    pending = enumerate(recipients)
+    results = {}
+
+    async def worker():
+        conn = None
+        try:
+            for index, (emails, context) in pending:
+                try:
+                    message = await sync_to_async(build_message)(emails, context)
+                    if conn is None:
+                        conn = get_async_connection()
+                        await conn.open()
+                    domains = throttle.get_domains(message.recipients())
+                    await throttle.scheduler.aacquire(domains)
+                    try:
+                        await conn.send(message)
+                    finally:
+                        throttle.scheduler.release(domains)
+                except Exception as e:
+                    results[index] = (emails, e)
+                else:
+                    results[index] = (emails, None)
+        finally:
+            if conn is not None:
+                await conn.close()
+
+    async def bounded_worker():
+        async with get_semaphore():
+            await worker()
+
+    max_connections = getattr(settings, "MAIL_FACTORY_ASYNC_MAX_CONNECTIONS", 10)
+    await asyncio.gather(*(bounded_worker() for _ in range(max_connections)))
+    return [results[index] for index in sorted(results)]
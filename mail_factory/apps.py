@@ -1,6 +1,7 @@
-from importlib import import_module
+from os.path import isfile
 
 from django.apps import AppConfig
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
 
@@ -12,8 +13,19 @@ class MailFactoryConfig(AppConfig):
 
     def ready(self):
         super().ready()
-        for app in self.apps.get_app_configs():
-            try:
-                import_module(name=".mails", package=app.module.__name__)
-            except ImportError:
-                pass
+        from mail_factory import factory
+
+        manifest = getattr(settings, "MAIL_FACTORY_MANIFEST", None)
+        if manifest and isfile(manifest):
+            # The mails modules are imported on first use.
+            factory.load_manifest(manifest)
+        else:
+            # The template index is built lazily, as the mails are rendered.
+            factory.autodiscover()
+
+        if getattr(settings, "MAIL_FACTORY_METRICS", False):
+            from mail_factory import metrics, signals
+
+            signals.phase_finished.connect(
+                metrics.phase_finished_handler, dispatch_uid="mail_factory_metrics"
+            )
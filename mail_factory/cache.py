@@ -0,0 +1,165 @@
+"""Process-local caches used to speed up the mail rendering."""
+
+import base64
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.autoreload import file_changed
+
+#: All the caches, cleared together when templates may have changed.
+caches = []
+
+
+class LRUCache:
+    """A thread-safe, size-bounded, least recently used cache.
+
+    The maximum size is read from the ``setting`` Django setting, and
+    defaults to ``default``. A maximum size of 0 disables the cache.
+
+    By default each value counts for one, ``sizeof`` may be given to weight
+    the values instead (eg: ``len`` for a maximum size in bytes).
+    """
+
+    def __init__(self, setting, default, sizeof=None):
+        self.setting = setting
+        self.default = default
+        self.sizeof = sizeof or (lambda value: 1)
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        caches.append(self)
+
+    @property
+    def maxsize(self):
+        return getattr(settings, self.setting, self.default)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if it isn't cached."""
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        """Cache the value for key, evicting the least recently used values.
+
+        Return the value so that it may be used inline.
+        """
+        maxsize = self.maxsize
+        size = self.sizeof(value)
+        if size > maxsize:
+            return value
+
+        with self._lock:
+            if key in self._data:
+                self._size -= self.sizeof(self._data.pop(key))
+            self._data[key] = value
+            self._size += size
+            while self._size > maxsize:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= self.sizeof(evicted)
+        return value
+
+    def clear(self):
+        """Empty the cache."""
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+
+class MappedFile(mmap.mmap):
+    """A memory-mapped attachment, pickled and copied as bytes.
+
+    So that the messages carrying it can still be queued or deep-copied.
+    """
+
+    def __reduce__(self):
+        return bytes, (self[:],)
+
+
+#: Attachments content, by path, modification time and size.
+attachment_cache = LRUCache(
+    "MAIL_FACTORY_ATTACHMENT_CACHE_SIZE", 10 * 1024 * 1024, sizeof=len
+)
+
+#: Memory-mapped attachments, by path, modification time and size.
+mapped_attachment_cache = LRUCache("MAIL_FACTORY_MAPPED_ATTACHMENT_CACHE_SIZE", 32)
+
+
+def read_attachment(path):
+    """Return the content of an attachment file.
+
+    The content is cached until the file changes. Files bigger than the
+    MAIL_FACTORY_ATTACHMENT_MMAP_SIZE setting are memory-mapped instead of
+    being read.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    mmap_size = getattr(settings, "MAIL_FACTORY_ATTACHMENT_MMAP_SIZE", 1024 * 1024)
+
+    if stat.st_size and stat.st_size >= mmap_size:
+        content = mapped_attachment_cache.get(key)
+        if content is None:
+            with open(path, "rb") as fd:
+                content = MappedFile(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            mapped_attachment_cache.set(key, content)
+        return content
+
+    content = attachment_cache.get(key)
+    if content is None:
+        with open(path, "rb") as fd:
+            content = attachment_cache.set(key, fd.read())
+    return content
+
+
+#: Data urls of the attachments, by path, modification time, size and mimetype.
+data_url_cache = LRUCache(
+    "MAIL_FACTORY_DATA_URL_CACHE_SIZE", 10 * 1024 * 1024, sizeof=len
+)
+
+
+def get_data_url(path, mimetype):
+    """Return the data url of an attachment file.
+
+    The data url is cached until the file changes.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, mimetype)
+    data_url = data_url_cache.get(key)
+    if data_url is None:
+        data = base64.b64encode(read_attachment(path)).decode("ascii")
+        data_url = data_url_cache.set(key, "data:%s;base64,%s" % (mimetype, data))
+    return data_url
+
+
+def clear_caches():
+    """Empty all the mail_factory caches."""
+    for cache in caches:
+        cache.clear()
+
+
+@receiver(file_changed, dispatch_uid="mail_factory_file_changed")
+def file_changed_handler(sender, file_path, **kwargs):
+    """Forget about the cached templates when a file changes in debug mode."""
+    if settings.DEBUG:
+        clear_caches()
+
+
+@receiver(setting_changed, dispatch_uid="mail_factory_setting_changed")
+def setting_changed_handler(sender, setting, **kwargs):
+    """Forget about the cached templates when the template settings change."""
+    if setting == "TEMPLATES":
+        clear_caches()
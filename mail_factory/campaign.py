@@ -0,0 +1,176 @@
+"""Render the mails of a campaign in a pool of processes.
+
+Rendering the templates and serializing the MIME messages is CPU-bound, so
+the mails of a big campaign are rendered by a pool of worker processes, each
+with Django set up and the templates loaded, while the parent process sends
+the already rendered messages.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+
+class RawMessage:
+    """An already serialized MIME message."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def as_bytes(self, linesep="\n"):
+        if linesep == "\r\n":
+            return self.data
+        return self.data.replace(b"\r\n", linesep.encode())
+
+    def get_charset(self):
+        return None
+
+
+class SerializedMessage:
+    """A message rendered in a worker process, ready to be sent.
+
+    It provides what the Django email backends use to send a message: the
+    ``from_email`` and ``encoding`` attributes, and the ``recipients()`` and
+    ``message()`` methods.
+    """
+
+    def __init__(self, from_email, all_recipients, data, encoding=None):
+        self.from_email = from_email
+        self.all_recipients = all_recipients
+        self.data = data
+        self.encoding = encoding
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(
+            message.from_email,
+            message.recipients(),
+            message.message().as_bytes(linesep="\r\n"),
+            message.encoding,
+        )
+
+    def recipients(self):
+        return self.all_recipients
+
+    def message(self):
+        return RawMessage(self.data)
+
+
+def _init_worker(template_name):
+    """Set Django up in a worker process and load the campaign templates."""
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if apps.ready:
+        # Forked from the parent process: don't share its database sockets.
+        for connection in connections.all():
+            connection.connection = None
+    else:
+        django.setup()
+
+    from mail_factory import factory
+
+    try:
+        factory.build_template_index([template_name])
+    except Exception:
+        # An unknown mail: each of its renderings reports the error.
+        pass
+
+
+def _render_chunk(template_name, chunk, attachments, from_email, headers):
+    """Render the (emails, context) pairs of the chunk in a worker process.
+
+    Return a list of serialized messages, or the exceptions raised while
+    rendering them.
+    """
+    from mail_factory import factory
+
+    mail_class = factory.get_mail_class(template_name)
+    results = []
+    for emails, context in chunk:
+        try:
+            message = mail_class(context).create_email_msg(
+                emails, attachments=attachments, from_email=from_email, headers=headers
+            )
+            results.append(SerializedMessage.from_message(message))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _chunks(recipients, size):
+    chunk = []
+    for pair in recipients:
+        chunk.append(pair)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def render_campaign(
+    template_name,
+    recipients,
+    attachments=None,
+    from_email=None,
+    headers=None,
+    processes=None,
+    mp_context=None,
+):
+    """Render a mail for each (emails, context) pair in a pool of processes.
+
+    The recipients are sent to the workers by chunks of
+    MAIL_FACTORY_CAMPAIGN_CHUNK_SIZE (16 by default) and only a few chunks by
+    worker are rendered ahead, so the recipients may be a generator of any
+    size. The contexts must be picklable.
+
+    The number of processes defaults to the MAIL_FACTORY_CAMPAIGN_PROCESSES
+    setting, or to the number of CPUs.
+
+    Yield an (emails, message) pair for each recipient in the recipients
+    order, the message being a SerializedMessage, or the exception raised
+    while rendering it.
+    """
+    if processes is None:
+        processes = getattr(settings, "MAIL_FACTORY_CAMPAIGN_PROCESSES", None)
+    processes = processes or os.cpu_count() or 1
+    chunk_size = getattr(settings, "MAIL_FACTORY_CAMPAIGN_CHUNK_SIZE", 16)
+
+    chunks = _chunks(recipients, chunk_size)
+    pending = deque()
+    with ProcessPoolExecutor(
+        processes,
+        mp_context=mp_context,
+        initializer=_init_worker,
+        initargs=(template_name,),
+    ) as executor:
+
+        def submit():
+            for chunk in chunks:
+                future = executor.submit(
+                    _render_chunk,
+                    template_name,
+                    chunk,
+                    attachments,
+                    from_email,
+                    headers,
+                )
+                pending.append((chunk, future))
+                return True
+            return False
+
+        while len(pending) < processes * 2 and submit():
+            pass
+        while pending:
+            chunk, future = pending.popleft()
+            submit()
+            try:
+                messages = future.result()
+            except Exception as e:
+                messages = [e] * len(chunk)
+            for (emails, _), message in zip(chunk, messages):
+                yield emails, message
@@ -21,10 +21,14 @@ class PasswordResetForm(DjangoPasswordResetForm):
         from_email=None,
         request=None,
         extra_email_context=None,
+        mail_async=False,
     ):
         """
         Generates a one-use only link for resetting password and sends to the
         user.
+
+        If mail_async is True, the mail is sent from a thread, see
+        mail_factory.dispatch.
         """
         email = self.cleaned_data["email"]
         for user in self.get_users(email):
@@ -51,4 +55,7 @@ class PasswordResetForm(DjangoPasswordResetForm):
             else:
                 mail = PasswordResetMail(context)
 
-            mail.send(emails=[user.email], from_email=from_email)
+            if mail_async:
+                mail.send_async(emails=[user.email], from_email=from_email)
+            else:
+                mail.send(emails=[user.email], from_email=from_email)
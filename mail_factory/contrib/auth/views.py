@@ -9,6 +9,7 @@ class PasswordResetView(DjangoPasswordResetView):
 
     form_class = PasswordResetForm
     email_template_name = None
+    mail_async = False
 
     def form_valid(self, form):
         opts = {
@@ -18,6 +19,7 @@ class PasswordResetView(DjangoPasswordResetView):
             "email_template_name": self.email_template_name,
             "request": self.request,
             "extra_email_context": self.extra_email_context,
+            "mail_async": self.mail_async,
         }
         form.mail_factory_email(**opts)
         return HttpResponseRedirect(self.get_success_url())
@@ -0,0 +1,141 @@
+"""Send the mails from a pool of threads."""
+
+import atexit
+import functools
+import logging
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from . import exceptions, signals
+
+logger = logging.getLogger("mail_factory")
+
+
+def log_error(message, future):
+    """Log the exception raised while sending the message, if any.
+
+    So that the failures aren't lost when nobody waits on the future.
+    """
+    if future.cancelled() or future.exception() is None:
+        return
+    logger.error(
+        "Couldn't send the %s mail to %s",
+        getattr(message, "template_name", None),
+        ", ".join(message.recipients()),
+        exc_info=future.exception(),
+    )
+
+
+class Dispatcher:
+    """Send the messages from a bounded pool of threads.
+
+    At most MAIL_FACTORY_DISPATCH_WORKERS threads (4 by default) send the
+    messages, and at most MAIL_FACTORY_DISPATCH_QUEUE_SIZE messages (100 by
+    default) wait for a thread. When the queue is full, send() waits for a
+    free slot, or raises a MailFactoryError if MAIL_FACTORY_DISPATCH_BLOCK is
+    False.
+
+    Each thread keeps its backend connection open between the messages.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._local = threading.local()
+        self._connections = []
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                workers = getattr(settings, "MAIL_FACTORY_DISPATCH_WORKERS", 4)
+                queue_size = getattr(settings, "MAIL_FACTORY_DISPATCH_QUEUE_SIZE", 100)
+                self._slots = threading.BoundedSemaphore(workers + queue_size)
+                self._executor = ThreadPoolExecutor(
+                    workers, thread_name_prefix="mail_factory"
+                )
+            return self._executor, self._slots
+
+    def send(self, message):
+        """Send the message from a thread, return a Future.
+
+        The Future result is the number of messages sent by the backend. The
+        exceptions are logged with the mail_factory logger.
+        """
+        executor, slots = self._get_executor()
+        block = getattr(settings, "MAIL_FACTORY_DISPATCH_BLOCK", True)
+        if not slots.acquire(blocking=block):
+            raise exceptions.MailFactoryError("The mail dispatcher queue is full")
+        try:
+            future = executor.submit(self._send, message)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda future: slots.release())
+        future.add_done_callback(functools.partial(log_error, message))
+        return future
+
+    def _send(self, message):
+        started = signals.start()
+        connection = None
+        try:
+            connection = self.get_connection()
+            try:
+                sent = connection.send_messages([message])
+            except smtplib.SMTPServerDisconnected:
+                # The server closed the idle connection: reconnect and try again.
+                self.close_connection()
+                connection = self.get_connection()
+                sent = connection.send_messages([message])
+        except Exception as e:
+            signals.finish_message(connection.__class__, "send", started, message, e)
+            raise
+        signals.finish_message(connection.__class__, "send", started, message)
+        return sent
+
+    def get_connection(self):
+        """Return the opened backend connection of the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = get_connection()
+            connection.open()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def close_connection(self):
+        """Close the backend connection of the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            self._local.connection = None
+            with self._lock:
+                self._connections.remove(connection)
+            connection.close()
+
+    def shutdown(self, wait=True):
+        """Stop the threads once the queued messages are sent.
+
+        If wait is False, return immediately: the queued messages are still
+        sent, but the connections are left open.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+
+        executor.shutdown(wait=wait)
+        if wait:
+            with self._lock:
+                connections, self._connections = self._connections, []
+            for connection in connections:
+                connection.close()
+
+
+#: The process-wide dispatcher.
+dispatcher = Dispatcher()
+atexit.register(dispatcher.shutdown)
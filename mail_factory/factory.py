@@ -1,13 +1,34 @@
-import base64
+import bisect
+import json
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.loader import select_template
 
 from . import exceptions
-from .forms import MailForm
+
+
+class _DefaultMailForm:
+    """The MailForm class, imported on first access."""
+
+    def __get__(self, instance, owner):
+        from .forms import MailForm
+
+        return MailForm
 
 
 class MailFactory:
-    mail_form = MailForm
+    mail_form = _DefaultMailForm()
+    mail_parts = ("subject.txt", "body.txt", "body.html")
     _registry = {}  # Needed: django.utils.module_loading.autodiscover_modules.
     form_map = {}
+    _manifest = {}  # The modules registering the mails not imported yet.
+    _modules = {}  # The modules which registered the discovered mails.
+    catalog = {}  # The catalog entry of each registered mail, see get_catalog.
+    _catalog_names = []  # The sorted template names of the catalog.
 
     def register(self, mail_klass, mail_form=None):
         """Register a Mail class with an optional mail form."""
@@ -26,6 +47,8 @@ class MailFactory:
                 )
             )
         self._registry[mail_klass.template_name] = mail_klass
+        self._manifest.pop(mail_klass.template_name, None)
+        self.add_to_catalog(mail_klass)
 
         mail_form = mail_form or self.mail_form
         self.form_map[mail_klass.template_name] = mail_form
@@ -41,14 +64,207 @@ class MailFactory:
 
         del self._registry[key]
         del self.form_map[key]
+        self.remove_from_catalog(key)
+
+    def add_to_catalog(self, mail_class):
+        """Add the catalog entry of the mail, its templates not looked up yet."""
+        template_name = mail_class.template_name
+        class_path = "%s.%s" % (mail_class.__module__, mail_class.__qualname__)
+        params = list(getattr(mail_class, "params", []))
+        if template_name not in self.catalog:
+            bisect.insort(self._catalog_names, template_name)
+        self.catalog[template_name] = {
+            "template_name": template_name,
+            "mail_class": mail_class,
+            "class_name": mail_class.__name__,
+            "class_path": class_path,
+            "params": params,
+            "parts": None,
+            "languages": None,
+            "keywords": " ".join([template_name, class_path] + params).lower(),
+        }
+
+    def remove_from_catalog(self, template_name):
+        """Remove the catalog entry of the mail, if any."""
+        if self.catalog.pop(template_name, None) is not None:
+            index = bisect.bisect_left(self._catalog_names, template_name)
+            del self._catalog_names[index]
+
+    def _sync_catalog(self):
+        """Catch up with the registry changes which bypassed register.
+
+        Eg: django.utils.module_loading.autodiscover_modules restores the
+        registry when a mails module fails to import.
+        """
+        for template_name in list(self.catalog):
+            mail_class = self._registry.get(template_name)
+            if mail_class is not self.catalog[template_name]["mail_class"]:
+                self.remove_from_catalog(template_name)
+        for mail_class in self._registry.values():
+            if mail_class.template_name not in self.catalog:
+                self.add_to_catalog(mail_class)
+
+    def get_catalog(self, query=None):
+        """Return the catalog entries of the mails, sorted by template name.
+
+        Each entry is a dict with the template name, class name and path,
+        params, and the parts and languages found by index_templates, None
+        until then. If a query is given, only the entries matching all its
+        words are returned.
+        """
+        if self._manifest:
+            self.load_all()
+        if len(self.catalog) != len(self._registry):
+            self._sync_catalog()
+
+        words = (query or "").lower().split()
+        entries = []
+        for template_name in self._catalog_names:
+            entry = self.catalog[template_name]
+            if self._registry.get(template_name) is not entry["mail_class"]:
+                self._sync_catalog()
+                return self.get_catalog(query)
+            if all(word in entry["keywords"] for word in words):
+                entries.append(entry)
+        return entries
+
+    def autodiscover(self):
+        """Import the mails module of each installed application."""
+        from django.apps import apps
+
+        for app in apps.get_app_configs():
+            module = "%s.mails" % app.module.__name__
+            registered = set(self._registry)
+            try:
+                import_module(module)
+            except ImportError:
+                pass
+            for template_name in set(self._registry) - registered:
+                self._modules[template_name] = module
+
+    def get_manifest(self):
+        """Return the module registering each mail.
+
+        Loading a mail imports its module, which registers the mail class.
+        """
+        return {
+            template_name: {
+                "module": self._modules.get(template_name, mail_class.__module__)
+            }
+            for template_name, mail_class in sorted(self._registry.items())
+        }
+
+    def load_manifest(self, path):
+        """Register the mails of a manifest, to be imported on first use.
+
+        See the mailfactory_manifest management command.
+        """
+        with open(path, encoding="utf-8") as manifest:
+            for template_name, mail in json.load(manifest).items():
+                if template_name not in self._registry:
+                    self._manifest[template_name] = mail["module"]
+                    self._modules[template_name] = mail["module"]
+
+    def load(self, template_name):
+        """Import the module registering this mail, if not imported yet."""
+        module = self._manifest.get(template_name)
+        if module is None:
+            return
+        import_module(module)
+        if template_name not in self._registry:
+            self._manifest.pop(template_name)
+            raise exceptions.MailFactoryError(
+                "%s isn't registered by %s, the mail factory manifest is "
+                "outdated" % (template_name, module)
+            )
+
+    def load_all(self):
+        """Import the modules registering the mails not imported yet."""
+        for template_name in list(self._manifest):
+            self.load(template_name)
 
     def get_mail_class(self, template_name):
         """Return the registered mail class for this template name."""
+        self.load(template_name)
         if template_name not in self._registry:
             raise exceptions.MailFactoryError("%s is not registered" % template_name)
 
         return self._registry[template_name]
 
+    def get_lookup_mail(self, mail_class):
+        """Return a mail instance without context, to look up its templates.
+
+        The template lookup doesn't depend on the context for most mails, so
+        the params check is skipped.
+        """
+        mail = mail_class.__new__(mail_class)
+        mail.context = {}
+        mail.lang = None
+        return mail
+
+    def build_template_index(self, template_names=None):
+        """Look up which parts exist for the mails, in each language.
+
+        The result is kept in the template index, so that missing parts aren't
+        looked up again when the mails are rendered. The mails are the given
+        template names, or all the registered mails.
+
+        The index is otherwise filled as the mails are rendered. It holds at
+        most MAIL_FACTORY_TEMPLATE_CACHE_SIZE entries, so warming it for more
+        mails than that evicts the first ones.
+        """
+        if template_names is None:
+            template_names = list(self._registry)
+        for template_name in template_names:
+            mail = self.get_lookup_mail(self.get_mail_class(template_name))
+            try:
+                for lang, _ in settings.LANGUAGES:
+                    mail.lang = lang
+                    for part in self.mail_parts:
+                        mail.has_part(part, lang)
+            except Exception:
+                # The template lookup needs a context or a template is broken,
+                # the parts will be looked up when the mail is rendered.
+                continue
+
+    def index_templates(self, template_name):
+        """Look up the parts of a mail in each language, for the catalog.
+
+        A language is available if the mail has a subject and a body in it.
+        The templates are looked up without the template caches of the
+        sends, so that browsing the catalog doesn't evict them.
+        """
+        mail_class = self._registry[template_name]
+        mail = self.get_lookup_mail(mail_class)
+        parts = set()
+        languages = []
+        try:
+            for lang, _ in settings.LANGUAGES:
+                mail.lang = lang
+                found = set()
+                for part in self.mail_parts:
+                    try:
+                        select_template(mail.get_template_part(part, lang=lang))
+                    except TemplateDoesNotExist:
+                        continue
+                    found.add(part)
+                parts.update(found)
+                if "subject.txt" in found and found & {"body.txt", "body.html"}:
+                    languages.append(lang)
+        except Exception:
+            # The template lookup needs a context or a template is broken,
+            # the parts will be looked up when the mail is rendered.
+            parts = set()
+            languages = []
+
+        entry = self.catalog.get(template_name)
+        if entry is None or entry["mail_class"] is not mail_class:
+            self.add_to_catalog(mail_class)
+            entry = self.catalog[template_name]
+        entry["parts"] = [part for part in self.mail_parts if part in parts]
+        entry["languages"] = languages
+        return entry
+
     def get_mail_object(self, template_name, context=None):
         """Return the registered mail class instance for this template name."""
         mail_class = self.get_mail_class(template_name)
@@ -56,6 +272,7 @@ class MailFactory:
 
     def get_mail_form(self, template_name):
         """Return the registered MailForm for this template name."""
+        self.load(template_name)
         if template_name not in self.form_map:
             raise exceptions.MailFactoryError(
                 "No form registered for %s" % template_name
@@ -70,10 +287,95 @@ class MailFactory:
         attachments=None,
         from_email=None,
         headers=None,
+        deferred=False,
+    ):
+        """Send a mail given its template_name.
+
+        If deferred is True, the mail is rendered right away and written to
+        the spool, see BaseMail.send.
+        """
+        mail = self.get_mail_object(template_name, context)
+        mail.send(emails, attachments, from_email, headers, deferred=deferred)
+
+    def mail_async(
+        self,
+        template_name,
+        emails,
+        context,
+        attachments=None,
+        from_email=None,
+        headers=None,
     ):
-        """Send a mail given its template_name."""
+        """Send a mail given its template_name from a thread, return a Future.
+
+        The mail is rendered right away, see BaseMail.send_async.
+        """
         mail = self.get_mail_object(template_name, context)
-        mail.send(emails, attachments, from_email, headers)
+        return mail.send_async(emails, attachments, from_email, headers)
+
+    def mail_many(
+        self, template_name, recipients, attachments=None, from_email=None, headers=None
+    ):
+        """Send a mail for each (emails, context) pair in recipients.
+
+        Return a list of (emails, error) tuples, see BaseMail.send_many.
+        """
+        mail_class = self.get_mail_class(template_name)
+        return mail_class.send_many(recipients, attachments, from_email, headers)
+
+    def mail_campaign(
+        self,
+        template_name,
+        recipients,
+        attachments=None,
+        from_email=None,
+        headers=None,
+        connection=None,
+        processes=None,
+    ):
+        """Send a mail for each (emails, context) pair in recipients.
+
+        The mails are rendered in a pool of processes and sent through a
+        single connection, see mail_factory.campaign.render_campaign.
+
+        Return a list of (emails, error) tuples, see BaseMail.send_many.
+        """
+        from .campaign import render_campaign
+        from .messages import send_messages
+
+        self.get_mail_class(template_name)  # Fail early if not registered.
+        messages = render_campaign(
+            template_name,
+            recipients,
+            attachments=attachments,
+            from_email=from_email,
+            headers=headers,
+            processes=processes,
+        )
+        return send_messages(messages, connection=connection)
+
+    async def amail(
+        self,
+        template_name,
+        emails,
+        context,
+        attachments=None,
+        from_email=None,
+        headers=None,
+    ):
+        """Send a mail given its template_name, asynchronously."""
+        mail = await sync_to_async(self.get_mail_object)(template_name, context)
+        await mail.asend(emails, attachments, from_email, headers)
+
+    async def amail_many(
+        self, template_name, recipients, attachments=None, from_email=None, headers=None
+    ):
+        """Send a mail for each (emails, context) pair, asynchronously.
+
+        Return a list of (emails, error) tuples, see BaseMail.asend_many.
+        """
+        mail_class = self.get_mail_class(template_name)
+        return await mail_class.asend_many(recipients, attachments, from_email, headers)
 
     def mail_admins(self, template_name, context, attachments=None, from_email=None):
         """Send a mail given its template name to admins."""
@@ -86,19 +388,32 @@ class MailFactory:
         mail_content = mail._render_part("body.html", lang=lang)
 
         if cid_to_data:
-            attachments = mail.get_attachments()
-            for filepath, filename, mimetype in attachments:
-                with open(filepath, "rb") as attachment:
-                    if mimetype.startswith("image"):
-                        data_url_encode = "data:{};base64,{}".format(
-                            mimetype,
-                            base64.b64encode(attachment.read()),
-                        )
-                        mail_content = mail_content.replace(
-                            "cid:%s" % filename, data_url_encode
-                        )
+            mail_content = self.cid_to_data(mail_content, mail.get_attachments())
         return mail_content
 
+    def cid_to_data(self, html, attachments):
+        """Replace the cid of the attached images by data urls in the html.
+
+        The attachments are (filepath, filename, mimetype) tuples. The data
+        urls are cached, see mail_factory.cache.get_data_url, and replaced in
+        a single pass over the html.
+        """
+        from .cache import get_data_url
+        from .messages import get_filenames_pattern
+
+        images = {
+            "cid:%s" % filename: (filepath, mimetype)
+            for filepath, filename, mimetype in attachments
+            if mimetype.startswith("image")
+        }
+        if not images:
+            return html
+
+        def replace(match):
+            return get_data_url(*images[match.group(0)])
+
+        return get_filenames_pattern(images).sub(replace, html)
+
     def get_text_for(self, template_name, context, lang=None):
         """Return the rendered mail text body."""
         mail = self.get_mail_object(template_name, context)
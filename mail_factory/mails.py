@@ -1,14 +1,28 @@
+import hashlib
 from os.path import join
 
-import html2text
+from asgiref.sync import sync_to_async
 
 from django.conf import settings
 from django.template import TemplateDoesNotExist
 from django.template.loader import select_template
 from django.utils import translation
 
-from . import exceptions
-from .messages import EmailMultiRelated
+from . import aio, exceptions, signals, spool
+from .cache import LRUCache, read_attachment
+from .dispatch import dispatcher
+from .messages import EmailMultiRelated, send_messages
+from .pool import pool
+
+#: Resolved templates, by tuple of template path candidates.
+template_cache = LRUCache("MAIL_FACTORY_TEMPLATE_CACHE_SIZE", 1024)
+
+#: Text bodies built from html, by html digest and conversion options.
+text_cache = LRUCache("MAIL_FACTORY_TEXT_CACHE_SIZE", 256)
+
+#: Whether a template exists, by tuple of template path candidates. It is
+#: bounded by the same setting as the template cache.
+template_index = LRUCache("MAIL_FACTORY_TEMPLATE_CACHE_SIZE", 1024)
 
 
 class BaseMail:
@@ -22,10 +36,15 @@ class BaseMail:
      * get_params: to build the mandatory variable list in the mail context
      * get_context_data: to add global context such as SITE_NAME
      * get_template_part: to get the list of possible paths to get parts.
+     * html2text_options: the html2text.HTML2Text attributes used to build
+       the text body when there is no body.txt template.
     """
 
+    html2text_options = {}
+
     def __init__(self, context=None):
         """Create a mail instance from a context."""
+        started = signals.start()
         # Create the context
         context = context or {}
         self.context = self.get_context_data(**context)
@@ -35,6 +54,13 @@ class BaseMail:
         for key in self.get_params():
             if key not in context:
                 raise exceptions.MissingMailContextParamException(repr(key))
+        signals.finish(
+            self.__class__,
+            "context",
+            started,
+            template_name=getattr(self, "template_name", None),
+            lang=self.lang,
+        )
 
     def get_language(self):
         # Auto detect the current language
@@ -77,6 +103,27 @@ class BaseMail:
         # return the list of templates path candidates
         return templates
 
+    def _get_template(self, part, lang=None):
+        """Return the template of a mail part, or None if it doesn't exist."""
+        templates = tuple(self.get_template_part(part, lang=lang))
+        if template_index.get(templates) is False:
+            return None
+
+        tpl = template_cache.get(templates)
+        if tpl is None:
+            try:
+                tpl = select_template(templates)
+            except TemplateDoesNotExist:
+                template_index.set(templates, False)
+                return None
+            template_index.set(templates, True)
+            template_cache.set(templates, tpl)
+        return tpl
+
+    def has_part(self, part, lang=None):
+        """Return True if there is a template for this mail part."""
+        return self._get_template(part, lang=lang) is not None
+
     def _render_part(self, part, lang=None):
         """Render a mail part against the mail context.
 
@@ -87,10 +134,54 @@ class BaseMail:
           * body.html
 
         """
-        tpl = select_template(self.get_template_part(part, lang=lang))
+        tpl = self._get_template(part, lang=lang)
+        if tpl is None:
+            raise TemplateDoesNotExist(
+                ", ".join(self.get_template_part(part, lang=lang))
+            )
+        started = signals.start()
         with translation.override(lang or self.lang):
             rendered = tpl.render(self.context)
-        return rendered.strip()
+        rendered = rendered.strip()
+        if started is not None:
+            signals.finish(
+                self.__class__,
+                "render",
+                started,
+                template_name=self.template_name,
+                lang=lang or self.lang,
+                size=len(rendered.encode("utf-8")),
+                part=part,
+            )
+        return rendered
+
+    def html_to_text(self, html):
+        """Return the text body built from the html body.
+
+        The conversions are cached, so that the same html is only converted
+        once.
+        """
+        started = signals.start()
+        options = tuple(sorted(self.html2text_options.items()))
+        key = (hashlib.sha1(html.encode("utf-8")).hexdigest(), options)
+        text = text_cache.get(key)
+        if text is None:
+            import html2text  # Only needed by the html only mails.
+
+            converter = html2text.HTML2Text()
+            for name, value in options:
+                setattr(converter, name, value)
+            text = text_cache.set(key, converter.handle(html))
+        if started is not None:
+            signals.finish(
+                self.__class__,
+                "html2text",
+                started,
+                template_name=self.template_name,
+                lang=self.lang,
+                size=len(text.encode("utf-8")),
+            )
+        return text
 
     def create_email_msg(
         self,
@@ -105,14 +196,12 @@ class BaseMail:
 
         from_email = from_email or settings.DEFAULT_FROM_EMAIL
         subject = self._render_part("subject.txt", lang=lang)
-        try:
+        body = None
+        if self.has_part("body.txt", lang=lang):
             body = self._render_part("body.txt", lang=lang)
-        except TemplateDoesNotExist:
-            body = None
-        try:
+        html_content = None
+        if self.has_part("body.html", lang=lang):
             html_content = self._render_part("body.html", lang=lang)
-        except TemplateDoesNotExist:
-            html_content = None
 
         # If we have neither a html or txt template
         if html_content is None and body is None:
@@ -121,8 +210,7 @@ class BaseMail:
         # If we have the html template only, we build automatically
         # txt content.
         if html_content is not None and body is None:
-            h = html2text.HTML2Text()
-            body = h.handle(html_content)
+            body = self.html_to_text(html_content)
 
         if headers is None:
             reply_to = getattr(settings, "NO_REPLY_EMAIL", None)
@@ -134,26 +222,141 @@ class BaseMail:
             headers = {"Reply-To": reply_to}
 
         msg = message_class(subject, body, from_email, emails, headers=headers)
+        msg.template_name = self.template_name
+        msg.lang = lang or self.lang
         if html_content:
             msg.attach_alternative(html_content, "text/html")
 
+        started = signals.start()
         attachments = self.get_attachments(attachments)
 
         if attachments:
             for filepath, filename, mimetype in attachments:
-                with open(filepath, "rb") as attachment:
-                    if mimetype.startswith("image"):
-                        msg.attach_related_file(filepath, mimetype, filename)
-                    else:
-                        msg.attach(filename, attachment.read(), mimetype)
+                if mimetype.startswith("image"):
+                    msg.attach_related_file(filepath, mimetype, filename)
+                else:
+                    content = read_attachment(filepath)
+                    if mimetype.startswith("text/"):
+                        # Text attachments are decoded: no memory-mapped file.
+                        content = bytes(content)
+                    msg.attach(filename, content, mimetype)
+        if started is not None:
+            signals.finish(
+                self.__class__,
+                "attachments",
+                started,
+                template_name=self.template_name,
+                lang=msg.lang,
+                size=signals.get_attachments_size(msg),
+                recipients=len(msg.recipients()),
+            )
         return msg
 
-    def send(self, emails, attachments=None, from_email=None, headers=None):
-        """Create the message and send it to emails."""
+    def send(
+        self,
+        emails,
+        attachments=None,
+        from_email=None,
+        headers=None,
+        connection=None,
+        deferred=False,
+    ):
+        """Create the message and send it to emails.
+
+        If deferred is True, the message is written to the spool instead, to
+        be sent by the mailfactory_worker management command.
+        """
         message = self.create_email_msg(
             emails, attachments=attachments, from_email=from_email, headers=headers
         )
-        message.send()
+        if deferred:
+            spool.spool_message(message)
+            return
+        if connection is not None:
+            started = signals.start()
+            message.connection = connection
+            try:
+                message.send()
+            except Exception as e:
+                signals.finish_message(
+                    connection.__class__, "send", started, message, e
+                )
+                raise
+            signals.finish_message(connection.__class__, "send", started, message)
+        else:
+            pool.send(message)
+
+    @classmethod
+    def send_many(
+        cls,
+        recipients,
+        attachments=None,
+        from_email=None,
+        headers=None,
+        connection=None,
+    ):
+        """Send a mail for each (emails, context) pair of recipients.
+
+        All the messages go through a single backend connection, opened once
+        for the whole batch. A failure for a recipient doesn't stop the batch.
+
+        Return a list of (emails, error) tuples in the recipients order, the
+        error being None if the mail was sent, or the raised exception.
+        """
+
+        def build_messages():
+            for emails, context in recipients:
+                try:
+                    message = cls(context).create_email_msg(
+                        emails,
+                        attachments=attachments,
+                        from_email=from_email,
+                        headers=headers,
+                    )
+                except Exception as e:
+                    yield emails, e
+                else:
+                    yield emails, message
+
+        return send_messages(build_messages(), connection=connection)
+
+    def send_async(self, emails, attachments=None, from_email=None, headers=None):
+        """Create the message and send it to emails from a thread.
+
+        Return a concurrent.futures.Future, see mail_factory.dispatch.
+        """
+        message = self.create_email_msg(
+            emails, attachments=attachments, from_email=from_email, headers=headers
+        )
+        return dispatcher.send(message)
+
+    async def asend(self, emails, attachments=None, from_email=None, headers=None):
+        """Create the message and send it to emails, asynchronously.
+
+        The message is rendered in a thread, so the templates can access the
+        database without blocking the event loop.
+        """
+        message = await sync_to_async(self.create_email_msg)(
+            emails, attachments=attachments, from_email=from_email, headers=headers
+        )
+        await aio.send_message(message)
+
+    @classmethod
+    async def asend_many(
+        cls, recipients, attachments=None, from_email=None, headers=None
+    ):
+        """Send a mail for each (emails, context) pair of recipients, asynchronously.
+
+        The messages are sent through concurrent connections, see
+        mail_factory.aio.send_many.
+        """
+
+        def build_message(emails, context):
+            return cls(context).create_email_msg(
+                emails, attachments=attachments, from_email=from_email, headers=headers
+            )
+
+        return await aio.send_many(build_message, recipients)
 
     def mail_admins(self, attachments=None, from_email=None):
         """Send email to admins."""
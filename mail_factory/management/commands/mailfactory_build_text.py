@@ -0,0 +1,105 @@
+import re
+from os.path import dirname, isfile, join
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mail_factory import factory
+
+#: First line of the built body.txt templates.
+HEADER = "{# Built from body.html by mailfactory_build_text, do not edit. #}\n"
+
+TAG_RE = re.compile(r"{%.*?%}|{{.*?}}|{#.*?#}", re.DOTALL)
+PLACEHOLDER_RE = re.compile(r"MAILFACTORYTAG(\d+)END")
+EXTENDS_RE = re.compile(r"{%\s*extends\s")
+
+
+def html_template_to_text(mail, source):
+    """Convert a body.html template source to a body.txt template source.
+
+    The template tags and variables are kept as is, and the html is converted
+    using the mail html2text options.
+    """
+    tags = []
+
+    def protect(match):
+        tags.append(match.group(0))
+        return "MAILFACTORYTAG%dEND" % (len(tags) - 1)
+
+    text = mail.html_to_text(TAG_RE.sub(protect, source))
+    text = PLACEHOLDER_RE.sub(lambda match: tags[int(match.group(1))], text)
+    # The html was already escaped, the text must not be escaped again.
+    return "%s{%% autoescape off %%}%s{%% endautoescape %%}\n" % (HEADER, text)
+
+
+class Command(BaseCommand):
+    help = (
+        "Build a body.txt template next to the body.html template of each "
+        "registered mail without a text body."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help=(
+                "Don't write anything, exit with an error if a body.txt "
+                "template is missing or outdated."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        outdated = []
+        for path, content in sorted(self.get_text_templates().items()):
+            if isfile(path):
+                with open(path, encoding="utf-8") as template:
+                    if template.read() == content:
+                        continue
+            outdated.append(path)
+            if not options["check"]:
+                with open(path, "w", encoding="utf-8") as template:
+                    template.write(content)
+                self.stdout.write("Built %s" % path)
+
+        if options["check"] and outdated:
+            raise CommandError(
+                "%d body.txt templates are missing or outdated, run "
+                "mailfactory_build_text:\n%s" % (len(outdated), "\n".join(outdated))
+            )
+
+    def get_text_templates(self):
+        """Return the body.txt templates to build, by path."""
+        templates = {}
+        seen = set()
+        factory.load_all()
+        for template_name, mail_class in sorted(factory._registry.items()):
+            mail = factory.get_lookup_mail(mail_class)
+            for lang, _ in settings.LANGUAGES:
+                html = mail._get_template("body.html", lang=lang)
+                if html is None or not isfile(html.origin.name):
+                    continue
+                text = mail._get_template("body.txt", lang=lang)
+                if text is not None and not self.is_built(text.origin.name):
+                    continue  # Written by hand.
+                if html.origin.name in seen:
+                    continue
+                seen.add(html.origin.name)
+
+                with open(html.origin.name, encoding="utf-8") as template:
+                    source = template.read()
+                if EXTENDS_RE.search(source):
+                    self.stderr.write(
+                        "Skipping %s: extended templates can't be converted"
+                        % html.origin.name
+                    )
+                    continue
+                path = join(dirname(html.origin.name), "body.txt")
+                templates[path] = html_template_to_text(mail, source)
+        return templates
+
+    def is_built(self, path):
+        """Return True if the template was built by this command."""
+        if not isfile(path):
+            return False
+        with open(path, encoding="utf-8") as template:
+            return template.readline() == HEADER
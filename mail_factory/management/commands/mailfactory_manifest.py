@@ -0,0 +1,51 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mail_factory import factory
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the manifest of the registered mails, so that their modules "
+        "are imported on first use instead of at startup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            help="The manifest path, the MAIL_FACTORY_MANIFEST setting by default.",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Don't write anything, exit with an error if the manifest is "
+            "missing or outdated.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["output"] or getattr(settings, "MAIL_FACTORY_MANIFEST", None)
+        if not path:
+            raise CommandError(
+                "Set the MAIL_FACTORY_MANIFEST setting or the --output option"
+            )
+
+        factory.load_all()
+        factory.autodiscover()
+        content = json.dumps(factory.get_manifest(), indent=2) + "\n"
+
+        if options["check"]:
+            try:
+                with open(path, encoding="utf-8") as manifest:
+                    if manifest.read() == content:
+                        return
+            except FileNotFoundError:
+                pass
+            raise CommandError(
+                "%s is missing or outdated, run mailfactory_manifest" % path
+            )
+
+        with open(path, "w", encoding="utf-8") as manifest:
+            manifest.write(content)
+        self.stdout.write("Wrote %d mails to %s" % (len(factory._registry), path))
@@ -0,0 +1,212 @@
+import csv
+import itertools
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mail_factory import exceptions, factory
+
+
+def read_rows(lines, input_format):
+    """Yield the (emails, context) pair of each line.
+
+    The ``emails`` field of each row holds the recipients, separated by
+    commas in a CSV file or as a string or list in a JSONL file, and the
+    other fields are the mail context.
+
+    A row which can't be read is yielded as an ([], exception) pair.
+    """
+    if input_format == "csv":
+        rows = csv.DictReader(lines)
+    else:
+        rows = (line for line in lines if line.strip())
+
+    while True:
+        try:
+            # Read in the try: a malformed CSV row raises a csv.Error here.
+            row = next(rows)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            yield [], e
+            continue
+        try:
+            if input_format != "csv":
+                row = json.loads(row)
+                if not isinstance(row, dict):
+                    raise ValueError("A row must be an object")
+            context = dict(row)
+            emails = context.pop("emails", None)
+            if isinstance(emails, str):
+                emails = [email.strip() for email in emails.split(",")]
+            if not emails or not all(emails):
+                raise ValueError("The emails field is missing")
+        except ValueError as e:
+            yield [], e
+        else:
+            yield emails, context
+
+
+class Command(BaseCommand):
+    help = (
+        "Send a mail for each row of a CSV or JSONL file. The emails field of "
+        "each row holds the recipients, the other fields are the context."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("template_name")
+        parser.add_argument(
+            "--input", required=True, help="The CSV or JSONL file, - for stdin."
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="The input format, guessed from the file extension by default.",
+        )
+        parser.add_argument(
+            "--log",
+            help=(
+                "Write the result of each row to this file as JSONL, "
+                "instead of the standard output."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of mails sent through a connection (default: 100).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of batches sent at once (default: 1).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Render the mails without sending them.",
+        )
+        parser.add_argument(
+            "--report-interval",
+            type=float,
+            default=5,
+            help="Seconds between two throughput reports (default: 5).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            self.mail_class = factory.get_mail_class(options["template_name"])
+        except exceptions.MailFactoryError as e:
+            raise CommandError(e)
+        if options["batch_size"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--batch-size and --concurrency must be positive")
+        self.dry_run = options["dry_run"]
+
+        input_format = options["format"]
+        if input_format is None:
+            input_format = "csv" if options["input"].endswith(".csv") else "jsonl"
+
+        if options["input"] == "-":
+            lines = sys.stdin
+        else:
+            try:
+                lines = open(options["input"], newline="", encoding="utf-8")
+            except OSError as e:
+                raise CommandError(e)
+        log = self.stdout
+        if options["log"]:
+            log = open(options["log"], "w", encoding="utf-8")
+
+        try:
+            rows = read_rows(lines, input_format)
+            batches = iter(
+                lambda: list(itertools.islice(rows, options["batch_size"])), []
+            )
+            self.send(batches, log, options["concurrency"], options["report_interval"])
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+            if log is not self.stdout:
+                log.close()
+
+    def send(self, batches, log, concurrency, report_interval):
+        """Send the batches, concurrency at a time, and log the results.
+
+        Only a few batches are read ahead, so that the memory use doesn't
+        depend on the input size.
+        """
+        self.start = self.last_report = time.monotonic()
+        self.line = self.sent = self.failed = 0
+        pending = deque()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for batch in batches:
+                pending.append(executor.submit(self.send_batch, batch))
+                if len(pending) >= concurrency * 2:
+                    self.log_results(pending.popleft().result(), log)
+                    if time.monotonic() - self.last_report >= report_interval:
+                        self.report()
+            while pending:
+                self.log_results(pending.popleft().result(), log)
+        self.report()
+
+    def send_batch(self, batch):
+        """Send the (emails, context) pairs, return the (emails, error) pairs.
+
+        The rows missing a mandatory context param fail when their mail is
+        created, before being rendered, see BaseMail.get_params.
+        """
+        valid = [
+            (emails, context)
+            for emails, context in batch
+            if not isinstance(context, Exception)
+        ]
+
+        if self.dry_run:
+            results = []
+            for emails, context in valid:
+                try:
+                    self.mail_class(context).create_email_msg(emails).message()
+                except Exception as e:
+                    results.append((emails, e))
+                else:
+                    results.append((emails, None))
+        else:
+            results = self.mail_class.send_many(valid)
+
+        sent = iter(results)
+        return [
+            (emails, context) if isinstance(context, Exception) else next(sent)
+            for emails, context in batch
+        ]
+
+    def log_results(self, results, log):
+        for emails, error in results:
+            self.line += 1
+            result = {"row": self.line, "emails": emails, "status": "sent"}
+            if self.dry_run:
+                result["status"] = "rendered"
+            if error is None:
+                self.sent += 1
+            else:
+                self.failed += 1
+                result.update(status="failed", error=str(error))
+            log.write(json.dumps(result) + "\n")
+
+    def report(self):
+        self.last_report = time.monotonic()
+        elapsed = self.last_report - self.start
+        self.stderr.write(
+            "%d rows, %d %s, %d failed, %.1f mails/s"
+            % (
+                self.line,
+                self.sent,
+                "rendered" if self.dry_run else "sent",
+                self.failed,
+                self.line / elapsed if elapsed else 0,
+            )
+        )
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mail_factory import spool
+
+
+class Command(BaseCommand):
+    help = "Send the mails deferred to the spool directory."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send the mails which are due, then exit.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait between two checks of the spool (default: 5).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Maximum number of mails sent through a single connection.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                sent, retried, failed = spool.process_spool(limit=options["batch_size"])
+                if sent or retried or failed:
+                    self.stdout.write(
+                        "%d sent, %d to retry, %d failed" % (sent, retried, failed)
+                    )
+                if options["batch_size"] and (sent or retried or failed):
+                    continue  # More mails may be due.
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
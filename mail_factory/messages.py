@@ -1,10 +1,123 @@
+import hashlib
 import re
+import smtplib
 from email.mime.base import MIMEBase
 from os.path import basename
 
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives, SafeMIMEMultipart
 
+from . import signals, throttle
+from .cache import LRUCache, read_attachment
+from .pool import close_connection, pool
+
+#: Related attachments MIME parts, by filename, content digest and mimetype.
+related_part_cache = LRUCache("MAIL_FACTORY_RELATED_PART_CACHE_SIZE", 0)
+
+#: Compiled filenames patterns, by filenames.
+filenames_pattern_cache = LRUCache("MAIL_FACTORY_PATTERN_CACHE_SIZE", 128)
+
+
+def get_filenames_pattern(filenames):
+    """Return the compiled regex matching any of the filenames.
+
+    The longest filenames are matched first. The compiled regexes are cached,
+    so that each set of filenames is only compiled once.
+    """
+    key = tuple(sorted(set(filenames)))
+    regex = filenames_pattern_cache.get(key)
+    if regex is None:
+        alternatives = sorted(key, key=len, reverse=True)
+        regex = re.compile("|".join(re.escape(f) for f in alternatives))
+        filenames_pattern_cache.set(key, regex)
+    return regex
+
+
+def add_cid(match):
+    """Prefix the matched filename with "cid:", unless it already is."""
+    if match.string.endswith("cid:", 0, match.start()):
+        return match.group(0)
+    return "cid:" + match.group(0)
+
+
+def _get_message_domains(item):
+    index, (emails, message) = item
+    if isinstance(message, Exception):
+        return frozenset()
+    return throttle.get_domains(message.recipients())
+
+
+def send_messages(messages, connection=None):
+    """Send the messages of (emails, message) pairs through one connection.
+
+    If the connection isn't given, one is borrowed from the connection pool,
+    or opened for all the messages and closed afterwards if the pool is
+    disabled. A given connection is closed afterwards if it wasn't open yet.
+    A failure for a message doesn't stop the others, and a message may also
+    be the exception raised while building it.
+
+    If the server closed the connection, it is opened again to send the
+    message once more. A borrowed connection which failed to send a message
+    isn't given back to the pool.
+
+    The messages are throttled by recipient domain, see
+    mail_factory.throttle.
+
+    Return a list of (emails, error) tuples in the messages order, the error
+    being None if the message was sent, or the exception.
+    """
+    if connection is not None:
+        opened = connection.open()
+        try:
+            return _send_messages(messages, connection)[0]
+        finally:
+            if opened:
+                close_connection(connection)
+
+    connection = pool.acquire()
+    try:
+        results, failed = _send_messages(messages, connection)
+    except BaseException:
+        close_connection(connection)
+        raise
+    if failed:
+        # The connection may be in any state.
+        close_connection(connection)
+    else:
+        pool.release(connection)
+    return results
+
+
+def _send_messages(messages, connection):
+    """Send the messages through the open connection.
+
+    Return the results and whether a message failed.
+    """
+    results = {}
+    failed = False
+    scheduled = throttle.scheduler.schedule(enumerate(messages), _get_message_domains)
+    for index, (emails, message) in scheduled:
+        if isinstance(message, Exception):
+            results[index] = (emails, message)
+            continue
+        started = signals.start()
+        try:
+            try:
+                connection.send_messages([message])
+            except smtplib.SMTPServerDisconnected:
+                # The server closed the connection: reconnect and try again.
+                close_connection(connection)
+                connection.open()
+                connection.send_messages([message])
+        except Exception as e:
+            failed = True
+            results[index] = (emails, e)
+            signals.finish_message(connection.__class__, "send", started, message, e)
+        else:
+            results[index] = (emails, None)
+            signals.finish_message(connection.__class__, "send", started, message)
+    return [results[index] for index in sorted(results)], failed
+
 
 # http://djangosnippets.org/snippets/2215/
 class EmailMultiRelated(EmailMultiAlternatives):
@@ -40,6 +153,12 @@ class EmailMultiRelated(EmailMultiAlternatives):
             alternatives,
         )
 
+    def message(self):
+        started = signals.start()
+        msg = super().message()
+        signals.finish_message(self.__class__, "mime", started, self)
+        return msg
+
     def attach_related(self, filename=None, content=None, mimetype=None):
         """
         Attaches a file with the given filename and content. The filename can
@@ -56,13 +175,14 @@ class EmailMultiRelated(EmailMultiAlternatives):
             self.related_attachments.append((filename, content, mimetype))
 
     def attach_related_file(self, path, mimetype=None, filename=None):
-        """Attaches a file from the filesystem."""
+        """Attaches a file from the filesystem.
+
+        The file content is cached, see mail_factory.cache.read_attachment.
+        """
         if not filename:
             filename = basename(path)
 
-        with open(path, "rb") as fd:
-            content = fd.read()
-
+        content = read_attachment(path)
         self.attach_related(filename, content, mimetype)
 
     def _create_message(self, msg):
@@ -72,13 +192,11 @@ class EmailMultiRelated(EmailMultiAlternatives):
 
     def _create_alternatives(self, msg):
         for i, (content, mimetype) in enumerate(self.alternatives):
-            if mimetype == "text/html":
-                for filename, _, _ in self.related_attachments:
-                    content = re.sub(
-                        r"(?<!cid:)%s" % re.escape(filename),
-                        "cid:%s" % filename,
-                        content,
-                    )
+            if mimetype == "text/html" and self.related_attachments:
+                regex = get_filenames_pattern(
+                    [filename for filename, _, _ in self.related_attachments]
+                )
+                content = regex.sub(add_cid, content)
                 self.alternatives[i] = (content, mimetype)
 
         return super()._create_alternatives(msg)
@@ -95,6 +213,26 @@ class EmailMultiRelated(EmailMultiAlternatives):
         return msg
 
     def _create_related_attachment(self, filename, content, mimetype=None):
+        """
+        Return the MIME attachment object of a related attachment.
+
+        If the MAIL_FACTORY_RELATED_PART_CACHE_SIZE setting is set, the MIME
+        attachments are cached and shared between the messages, so that the
+        same image is only encoded once: they must not be modified.
+        """
+        if not related_part_cache.maxsize:
+            return self._build_related_attachment(filename, content, mimetype)
+
+        data = content.encode() if isinstance(content, str) else content
+        key = (filename, hashlib.sha1(data).hexdigest(), mimetype, self.encoding)
+        attachment = related_part_cache.get(key)
+        if attachment is None:
+            attachment = related_part_cache.set(
+                key, self._build_related_attachment(filename, content, mimetype)
+            )
+        return attachment
+
+    def _build_related_attachment(self, filename, content, mimetype=None):
         """
         Convert the filename, content, mimetype triple into a MIME attachment
         object. Adjust headers to use Content-ID where applicable.
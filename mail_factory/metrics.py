@@ -0,0 +1,264 @@
+"""In-process metrics of the sent mails, in the Prometheus text format.
+
+The metrics are collected from the phase_finished signal (see
+mail_factory.signals) when the MAIL_FACTORY_METRICS setting is True, and
+exposed by the ``mail_factory_metrics`` admin view.
+
+With many worker processes, eg: gunicorn workers, set the
+MAIL_FACTORY_METRICS_DIR setting to a local directory: each process writes
+its metrics there every MAIL_FACTORY_METRICS_FLUSH_INTERVAL seconds (1 by
+default) and when it exits, and the view adds up the metrics of all the
+processes. The directory should be emptied when the server starts.
+"""
+
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger("mail_factory")
+
+#: The metrics, by name: (type, help, label names, histogram buckets).
+METRICS = {
+    "mail_factory_sent_total": (
+        "counter",
+        "Number of messages sent.",
+        ("template",),
+        None,
+    ),
+    "mail_factory_send_failures_total": (
+        "counter",
+        "Number of messages which couldn't be sent.",
+        ("template",),
+        None,
+    ),
+    "mail_factory_render_seconds": (
+        "histogram",
+        "Rendering time of the mail parts.",
+        ("template",),
+        (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+    ),
+    "mail_factory_message_size_bytes": (
+        "histogram",
+        "Size of the content of the sent messages.",
+        (),
+        (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+    ),
+    "mail_factory_message_recipients": (
+        "histogram",
+        "Number of recipients of the sent messages.",
+        (),
+        (1, 2, 5, 10, 25, 50, 100),
+    ),
+}
+
+
+class Metrics:
+    """The counters and histograms of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._pid = os.getpid()
+            self._flushed = time.monotonic()
+            # Counter values, and histogram (bucket counts, sum), by name and
+            # label values.
+            self.counters = defaultdict(float)
+            self.histograms = {}
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Forked: the metrics of the parent process aren't ours.
+            self.counters = defaultdict(float)
+            self.histograms = {}
+            self._pid = os.getpid()
+
+    def inc(self, name, labels=(), value=1):
+        """Increment a counter."""
+        with self._lock:
+            self._check_pid()
+            self.counters[name, labels] += value
+        self.maybe_flush()
+
+    def observe(self, name, value, labels=()):
+        """Add a value to a histogram."""
+        buckets = METRICS[name][3]
+        with self._lock:
+            self._check_pid()
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                # The last count is for the values above the last bucket.
+                counts = [0] * (len(buckets) + 1)
+                histogram = self.histograms[name, labels] = [counts, 0]
+            histogram[0][bisect_left(buckets, value)] += 1
+            histogram[1] += value
+        self.maybe_flush()
+
+    def snapshot(self):
+        """Return the metrics as a JSON serializable dict."""
+        with self._lock:
+            self._check_pid()
+            return {
+                "counters": [
+                    [name, list(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    [name, list(labels), list(counts), total]
+                    for (name, labels), (counts, total) in self.histograms.items()
+                ],
+            }
+
+    def maybe_flush(self):
+        """Write the metrics to the metrics directory from time to time.
+
+        Nothing is written if another thread is already writing them.
+        """
+        interval = getattr(settings, "MAIL_FACTORY_METRICS_FLUSH_INTERVAL", 1)
+        if time.monotonic() - self._flushed < interval:
+            return
+        if self._flush_lock.acquire(blocking=False):
+            try:
+                self._flush()
+            finally:
+                self._flush_lock.release()
+
+    def flush(self):
+        """Write the metrics of the process to the metrics directory.
+
+        The errors are logged, so that the metrics never break a send.
+        """
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        self._flushed = time.monotonic()
+        if not settings.configured:
+            return  # Eg: at exit, when the settings were never used.
+        metrics_dir = getattr(settings, "MAIL_FACTORY_METRICS_DIR", None)
+        if not metrics_dir:
+            return
+        path = os.path.join(metrics_dir, "%d.json" % os.getpid())
+        try:
+            os.makedirs(metrics_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=metrics_dir)
+            try:
+                with os.fdopen(fd, "w") as tmp_file:
+                    json.dump(self.snapshot(), tmp_file)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            logger.exception("Couldn't write the metrics to %s", metrics_dir)
+
+
+def get_snapshots():
+    """Return the snapshots of the metrics of all the processes."""
+    metrics_dir = getattr(settings, "MAIL_FACTORY_METRICS_DIR", None)
+    if not metrics_dir:
+        return [metrics.snapshot()]
+
+    metrics.flush()
+    try:
+        names = sorted(os.listdir(metrics_dir))
+    except OSError:
+        logger.exception("Couldn't read the metrics from %s", metrics_dir)
+        return [metrics.snapshot()]
+    snapshots = []
+    for name in names:
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(metrics_dir, name)) as fd:
+                    snapshots.append(json.load(fd))
+            except (OSError, ValueError):
+                continue  # Removed or being written.
+    return snapshots
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    labels = list(zip(names, values)) + list(extra)
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, _escape(v)) for name, v in labels)
+
+
+def _format_value(value):
+    return str(int(value)) if value == int(value) else repr(float(value))
+
+
+def render(snapshots=None):
+    """Return the metrics of all the processes in the Prometheus text format."""
+    if snapshots is None:
+        snapshots = get_snapshots()
+
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            counters[name, tuple(labels)] += value
+        for name, labels, counts, total in snapshot["histograms"]:
+            histogram = histograms.setdefault(
+                (name, tuple(labels)), [[0] * len(counts), 0]
+            )
+            histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+            histogram[1] += total
+
+    lines = []
+    for name, (metric_type, help_text, label_names, buckets) in METRICS.items():
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s %s" % (name, metric_type))
+        if metric_type == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    labels = _format_labels(label_names, labels)
+                    lines.append("%s%s %s" % (name, labels, _format_value(value)))
+            continue
+
+        for (metric, labels), (counts, total) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            count = 0
+            for bucket, bucket_count in zip(buckets + (None,), counts):
+                count += bucket_count
+                le = "+Inf" if bucket is None else _format_value(bucket)
+                bucket_labels = _format_labels(label_names, labels, [("le", le)])
+                lines.append("%s_bucket%s %d" % (name, bucket_labels, count))
+            labels = _format_labels(label_names, labels)
+            lines.append("%s_sum%s %s" % (name, labels, _format_value(total)))
+            lines.append("%s_count%s %d" % (name, labels, count))
+    return "\n".join(lines) + "\n"
+
+
+def phase_finished_handler(sender, phase, duration, template_name, **kwargs):
+    """Update the metrics, see mail_factory.signals."""
+    labels = (template_name or "",)
+    if phase == "render":
+        metrics.observe("mail_factory_render_seconds", duration, labels)
+    elif phase == "send":
+        if kwargs.get("error") is not None:
+            metrics.inc("mail_factory_send_failures_total", labels)
+            return
+        metrics.inc("mail_factory_sent_total", labels)
+        metrics.observe("mail_factory_message_size_bytes", kwargs["size"])
+        metrics.observe("mail_factory_message_recipients", kwargs["recipients"])
+
+
+#: The metrics of the process.
+metrics = Metrics()
+atexit.register(metrics.flush)
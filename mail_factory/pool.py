@@ -0,0 +1,175 @@
+"""A pool of open email backend connections, shared by the sends.
+
+The pool is disabled unless the MAIL_FACTORY_CONNECTION_POOL_SIZE setting is
+greater than 0: each send then opens and closes its own connection, as
+Django does.
+
+The idle connections are kept by backend settings, and are closed after
+MAIL_FACTORY_CONNECTION_IDLE_TIMEOUT seconds (60 by default). An SMTP
+connection idle for more than MAIL_FACTORY_CONNECTION_KEEPALIVE seconds (15
+by default) is checked with a NOOP command before being reused, and a
+connection closed by the server while sending is opened again.
+"""
+
+import atexit
+import contextlib
+import smtplib
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import signals
+
+
+def get_connection_key():
+    """Return the settings identifying the backend connections."""
+    return (
+        settings.EMAIL_BACKEND,
+        settings.EMAIL_HOST,
+        settings.EMAIL_PORT,
+        settings.EMAIL_HOST_USER,
+        settings.EMAIL_HOST_PASSWORD,
+        settings.EMAIL_USE_TLS,
+        settings.EMAIL_USE_SSL,
+        settings.EMAIL_TIMEOUT,
+        settings.EMAIL_SSL_CERTFILE,
+        settings.EMAIL_SSL_KEYFILE,
+    )
+
+
+def close_connection(connection):
+    """Close a connection which may be broken, ignoring the errors."""
+    try:
+        connection.close()
+    except Exception:
+        pass  # Already broken, and not used anymore.
+
+
+def is_alive(connection):
+    """Return False if the SMTP server closed the connection."""
+    smtp = getattr(connection, "connection", None)
+    if not isinstance(smtp, smtplib.SMTP):
+        return True
+    try:
+        return smtp.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+
+class ConnectionPool:
+    """Keep the backend connections open between the sends."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = defaultdict(list)  # (connection, released at), by key.
+
+    @property
+    def size(self):
+        return getattr(settings, "MAIL_FACTORY_CONNECTION_POOL_SIZE", 0)
+
+    def acquire(self):
+        """Return an open connection, from the pool if possible."""
+        key = get_connection_key()
+        timeout = getattr(settings, "MAIL_FACTORY_CONNECTION_IDLE_TIMEOUT", 60)
+        keepalive = getattr(settings, "MAIL_FACTORY_CONNECTION_KEEPALIVE", 15)
+        while True:
+            with self._lock:
+                if not self._idle[key]:
+                    break
+                connection, released = self._idle[key].pop()
+            idle = time.monotonic() - released
+            if idle < timeout and (idle < keepalive or is_alive(connection)):
+                return connection
+            close_connection(connection)
+
+        connection = get_connection()
+        connection.open()
+        return connection
+
+    def release(self, connection):
+        """Give the connection back to the pool, or close it if it's full."""
+        key = get_connection_key()
+        with self._lock:
+            if len(self._idle[key]) < self.size:
+                self._idle[key].append((connection, time.monotonic()))
+                return
+        close_connection(connection)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrow an open connection, given back to the pool afterwards.
+
+        If the pool is disabled, the connection is opened and then closed.
+        """
+        if not self.size:
+            connection = get_connection()
+            connection.open()
+            try:
+                yield connection
+            finally:
+                connection.close()
+            return
+
+        connection = self.acquire()
+        try:
+            yield connection
+        except BaseException:
+            # The connection may be in any state.
+            close_connection(connection)
+            raise
+        self.release(connection)
+
+    def send(self, message):
+        """Send the message through a pooled connection.
+
+        If the server closed the connection, a new one is opened to send the
+        message again.
+
+        Return the number of messages sent.
+        """
+        if not message.recipients():
+            return 0
+        started = signals.start()
+        connection = None
+        try:
+            if not self.size:
+                connection = get_connection()
+                sent = connection.send_messages([message])
+            else:
+                with self.connection() as connection:
+                    try:
+                        sent = connection.send_messages([message])
+                    except smtplib.SMTPServerDisconnected:
+                        close_connection(connection)
+                        connection.open()
+                        sent = connection.send_messages([message])
+        except Exception as e:
+            signals.finish_message(connection.__class__, "send", started, message, e)
+            raise
+        signals.finish_message(connection.__class__, "send", started, message)
+        return sent
+
+    def clear(self):
+        """Close all the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, defaultdict(list)
+        for connections in idle.values():
+            for connection, _ in connections:
+                close_connection(connection)
+
+
+#: The process-wide connection pool.
+pool = ConnectionPool()
+atexit.register(pool.clear)
+
+
+@receiver(setting_changed, dispatch_uid="mail_factory_pool_setting_changed")
+def setting_changed_handler(sender, setting, **kwargs):
+    """Close the idle connections when the pool is resized."""
+    if setting == "MAIL_FACTORY_CONNECTION_POOL_SIZE":
+        pool.clear()
@@ -0,0 +1,123 @@
+"""Signals reporting how long each phase of the send pipeline takes.
+
+phase_finished is sent at the end of each phase, with the arguments:
+
+ * phase: the phase name, see below.
+ * duration: the phase duration, in seconds.
+ * template_name and lang: the mail template name and language, if known.
+ * size: the size of the phase output in bytes, if known.
+ * recipients: the number of recipients, if known.
+
+The phases are:
+
+ * ``context``: the context build when a mail is created, sent by the mail
+   class.
+ * ``render``: the rendering of a mail part, sent by the mail class with the
+   extra ``part`` argument.
+ * ``html2text``: the text body built from the html body, sent by the mail
+   class.
+ * ``attachments``: the attachments loading, sent by the mail class.
+ * ``mime``: the MIME message construction, sent by the message class.
+ * ``send``: the backend send of a message, sent by the connection class
+   with the extra ``error`` argument, the exception raised if the message
+   couldn't be sent.
+
+The size of a message is the size of its body, alternatives and attachments
+content, without the MIME encoding.
+
+Nothing is measured while the signal has no receivers. The exceptions raised
+by the receivers are logged, so that they don't break the sends.
+"""
+
+import logging
+import time
+from email.mime.base import MIMEBase
+
+from django.dispatch import Signal
+
+logger = logging.getLogger("mail_factory")
+
+phase_finished = Signal()
+
+
+def start():
+    """Return the start time of a phase, None if nobody listens.
+
+    This is cheaper than Signal.has_listeners, and doesn't need a lock.
+    """
+    return time.perf_counter() if phase_finished.receivers else None
+
+
+def finish(sender, phase, started, **kwargs):
+    """Send phase_finished if the phase was measured by start."""
+    if started is None:
+        return
+    kwargs.setdefault("template_name", None)
+    kwargs.setdefault("lang", None)
+    kwargs.setdefault("size", None)
+    kwargs.setdefault("recipients", None)
+    responses = phase_finished.send_robust(
+        sender, phase=phase, duration=time.perf_counter() - started, **kwargs
+    )
+    for receiver, response in responses:
+        if isinstance(response, Exception):
+            logger.error(
+                "The %r receiver of the %s phase failed",
+                receiver,
+                phase,
+                exc_info=response,
+            )
+
+
+def finish_message(sender, phase, started, message, error=None):
+    """Send phase_finished for a message phase, with the message details.
+
+    The error is the exception raised if the message couldn't be sent.
+    """
+    if started is None:
+        return
+    finish(
+        sender,
+        phase,
+        started,
+        template_name=getattr(message, "template_name", None),
+        lang=getattr(message, "lang", None),
+        size=get_message_size(message),
+        recipients=len(message.recipients()),
+        error=error,
+    )
+
+
+def get_content_size(content):
+    """Return the size in bytes of an attachment or alternative content."""
+    if isinstance(content, str):
+        return len(content.encode("utf-8"))
+    if isinstance(content, MIMEBase):
+        return len(content.as_bytes())
+    return len(content)
+
+
+def get_attachments_size(message):
+    """Return the size in bytes of the attachments content of the message."""
+    size = 0
+    for attachments in (
+        getattr(message, "attachments", []),
+        getattr(message, "related_attachments", []),
+    ):
+        for attachment in attachments:
+            if isinstance(attachment, MIMEBase):
+                size += get_content_size(attachment)
+            else:
+                size += get_content_size(attachment[1])
+    return size
+
+
+def get_message_size(message):
+    """Return the size in bytes of the content of the message."""
+    data = getattr(message, "data", None)
+    if data is not None:
+        return len(data)  # Already serialized, see mail_factory.campaign.
+    size = get_content_size(message.body or "")
+    for content, mimetype in getattr(message, "alternatives", []):
+        size += get_content_size(content)
+    return size + get_attachments_size(message)
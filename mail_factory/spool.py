@@ -0,0 +1,166 @@
+"""A persistent outbox of rendered messages, in a local directory.
+
+The deferred mails are written to the MAIL_FACTORY_SPOOL_DIR directory, one
+JSON file per message, and sent by the ``mailfactory_worker`` management
+command. Each file is written in the ``tmp`` subdirectory and then renamed,
+so a worker never reads a partial message, and is locked while being sent, so
+many workers may drain the same spool.
+
+The messages which couldn't be sent after MAIL_FACTORY_SPOOL_MAX_ATTEMPTS
+attempts are moved to the ``failed`` subdirectory.
+"""
+
+import base64
+import json
+import os
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # Windows: the mails can be spooled, but not sent.
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from . import exceptions, signals
+from .campaign import SerializedMessage
+from .pool import close_connection
+
+
+def get_spool_dir():
+    """Return the spool directory, creating it if needed."""
+    spool_dir = getattr(settings, "MAIL_FACTORY_SPOOL_DIR", None)
+    if not spool_dir:
+        raise exceptions.MailFactoryError(
+            "The MAIL_FACTORY_SPOOL_DIR setting is needed to defer mails"
+        )
+    for subdir in ("tmp", "failed"):
+        os.makedirs(os.path.join(spool_dir, subdir), exist_ok=True)
+    return spool_dir
+
+
+def _write(path, record):
+    """Write the record to path atomically."""
+    tmp_path = os.path.join(get_spool_dir(), "tmp", os.path.basename(path))
+    with open(tmp_path, "w") as fd:
+        json.dump(record, fd)
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.replace(tmp_path, path)
+
+
+def spool_message(message):
+    """Write the message to the spool, return the path of its file."""
+    if not isinstance(message, SerializedMessage):
+        message = SerializedMessage.from_message(message)
+    record = {
+        "from_email": message.from_email,
+        "recipients": message.recipients(),
+        "data": base64.b64encode(message.data).decode("ascii"),
+        "encoding": message.encoding,
+        "attempts": 0,
+        "next_attempt": 0,
+        "error": None,
+    }
+    name = "%020d-%s.json" % (time.time_ns(), uuid.uuid4().hex)
+    path = os.path.join(get_spool_dir(), name)
+    _write(path, record)
+    return path
+
+
+def _retry(path, record, error):
+    """Schedule a new attempt, or move the message to the failed messages."""
+    record["attempts"] += 1
+    record["error"] = repr(error)
+    max_attempts = getattr(settings, "MAIL_FACTORY_SPOOL_MAX_ATTEMPTS", 5)
+    if record["attempts"] >= max_attempts:
+        _write(os.path.join(get_spool_dir(), "failed", os.path.basename(path)), record)
+        os.unlink(path)
+        return False
+
+    delay = getattr(settings, "MAIL_FACTORY_SPOOL_RETRY_DELAY", 60)
+    record["next_attempt"] = time.time() + delay * 2 ** (record["attempts"] - 1)
+    _write(path, record)
+    return True
+
+
+def process_spool(connection=None, limit=None):
+    """Send the spooled messages which are due, through a single connection.
+
+    The messages locked by another worker are skipped. If a message can't be
+    sent, it is retried later, the delay starting at
+    MAIL_FACTORY_SPOOL_RETRY_DELAY seconds (60 by default) and doubling after
+    each attempt.
+
+    At most limit messages are sent if it is given.
+
+    Return a (sent, retried, failed) tuple of message counts.
+    """
+    if fcntl is None:
+        raise exceptions.MailFactoryError(
+            "The spooled mails can't be sent on this platform, it has no fcntl"
+        )
+    spool_dir = get_spool_dir()
+    names = sorted(name for name in os.listdir(spool_dir) if name.endswith(".json"))
+
+    new_connection = connection is None
+    sent = retried = failed = 0
+    opened = False
+    try:
+        for name in names:
+            if limit is not None and sent + retried + failed >= limit:
+                break
+            path = os.path.join(spool_dir, name)
+            try:
+                fd = open(path)
+            except FileNotFoundError:
+                continue  # Sent by another worker.
+            with fd:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Being sent by another worker.
+                if os.fstat(fd.fileno()).st_nlink == 0:
+                    continue  # Sent or rescheduled by another worker.
+                record = json.load(fd)
+                if record["next_attempt"] > time.time():
+                    continue
+
+                message = SerializedMessage(
+                    record["from_email"],
+                    record["recipients"],
+                    base64.b64decode(record["data"]),
+                    record["encoding"],
+                )
+                started = signals.start()
+                try:
+                    if connection is None:
+                        connection = get_connection()
+                    if not opened:
+                        connection.open()
+                        opened = True
+                    connection.send_messages([message])
+                except Exception as e:
+                    signals.finish_message(
+                        connection.__class__, "send", started, message, e
+                    )
+                    if new_connection and opened:
+                        # The connection may be broken: open a new one.
+                        close_connection(connection)
+                        opened = False
+                    if _retry(path, record, e):
+                        retried += 1
+                    else:
+                        failed += 1
+                else:
+                    signals.finish_message(
+                        connection.__class__, "send", started, message
+                    )
+                    os.unlink(path)
+                    sent += 1
+    finally:
+        if new_connection and opened:
+            close_connection(connection)
+    return sent, retried, failed
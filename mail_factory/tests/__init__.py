@@ -1,5 +1,16 @@
+from .test_aio import *  # noqa
+from .test_cache import *  # noqa
+from .test_campaign import *  # noqa
+from .test_commands import *  # noqa
+from .test_dispatch import *  # noqa
 from .test_factory import *  # noqa
 from .test_forms import *  # noqa
+from .test_import import *  # noqa
 from .test_mails import *  # noqa
 from .test_messages import *  # noqa
+from .test_metrics import *  # noqa
+from .test_pool import *  # noqa
+from .test_signals import *  # noqa
+from .test_spool import *  # noqa
+from .test_throttle import *  # noqa
 from .test_views import *  # noqa
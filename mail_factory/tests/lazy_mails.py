@@ -0,0 +1,16 @@
+"""Mails registered on import, to test the lazily imported mails."""
+
+from .. import factory
+from ..forms import MailForm
+from ..mails import BaseMail
+
+
+class LazyMail(BaseMail):
+    template_name = "lazy"
+
+
+class LazyMailForm(MailForm):
+    pass
+
+
+factory.register(LazyMail, LazyMailForm)
@@ -0,0 +1,180 @@
+import asyncio
+import unittest
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from .. import aio, factory
+from ..mails import BaseMail
+
+try:
+    import aiosmtplib
+except ImportError:  # pragma: no cover
+    aiosmtplib = None
+
+
+class AsyncMail(BaseMail):
+    params = ["title"]
+    template_name = "test"
+
+
+class DatabaseMail(AsyncMail):
+    def get_context_data(self, **kwargs):
+        kwargs["users"] = User.objects.count()
+        return kwargs
+
+
+class SMTPServer:
+    """A minimal asyncio SMTP server, keeping the received messages."""
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.max_concurrent_connections = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.max_concurrent_connections = max(
+            self.connections, self.max_concurrent_connections
+        )
+        mail_from, rcpt_to = None, []
+        writer.write(b"220 localhost ESMTP\r\n")
+        try:
+            while True:
+                line = (await reader.readline()).decode()
+                command = line[:4].upper()
+                if not line or command == "QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    break
+                elif command in ("EHLO", "HELO"):
+                    writer.write(b"250 localhost\r\n")
+                elif command == "MAIL":
+                    mail_from, rcpt_to = line[10:].strip(), []
+                    writer.write(b"250 OK\r\n")
+                elif command == "RCPT":
+                    rcpt_to.append(line[8:].strip())
+                    writer.write(b"250 OK\r\n")
+                elif command == "DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    data = await reader.readuntil(b"\r\n.\r\n")
+                    await asyncio.sleep(0.01)  # let the other connections in
+                    self.messages.append((mail_from, rcpt_to, data))
+                    writer.write(b"250 OK\r\n")
+                else:
+                    writer.write(b"250 OK\r\n")
+                await writer.drain()
+        finally:
+            self.connections -= 1
+            writer.close()
+
+
+class AsyncSendTest(TestCase):
+    def setUp(self):
+        factory.register(AsyncMail)
+
+    def tearDown(self):
+        factory.unregister(AsyncMail)
+
+    def test_asend(self):
+        before = len(mail.outbox)
+        asyncio.run(AsyncMail({"title": "foo"}).asend(["foo@example.com"]))
+        self.assertEqual(len(mail.outbox), before + 1)
+        self.assertEqual(mail.outbox[-1].to, ["foo@example.com"])
+
+    def test_asend_many_database(self):
+        # The database isn't accessible from the event loop.
+        results = asyncio.run(
+            DatabaseMail.asend_many([(["foo@example.com"], {"title": "foo"})])
+        )
+        self.assertEqual(results, [(["foo@example.com"], None)])
+
+    def test_amail(self):
+        before = len(mail.outbox)
+        asyncio.run(factory.amail("test", ["foo@example.com"], {"title": "foo"}))
+        self.assertEqual(len(mail.outbox), before + 1)
+
+    @override_settings(MAIL_FACTORY_ASYNC_MAX_CONNECTIONS=2)
+    def test_amail_many(self):
+        before = len(mail.outbox)
+        results = asyncio.run(
+            factory.amail_many(
+                "test",
+                [
+                    (["foo@example.com"], {"title": "foo"}),
+                    (["bar@example.com"], {}),  # missing param
+                    (["baz@example.com"], {"title": "baz"}),
+                ],
+            )
+        )
+        self.assertEqual(len(mail.outbox), before + 2)
+        self.assertEqual(results[0], (["foo@example.com"], None))
+        self.assertEqual(results[1][0], ["bar@example.com"])
+        self.assertIsNotNone(results[1][1])
+        self.assertEqual(results[2], (["baz@example.com"], None))
+
+
+@unittest.skipIf(aiosmtplib is None, "aiosmtplib is not installed")
+class AsyncSMTPSendTest(TestCase):
+    def run_with_server(self, coroutine_function, **settings):
+        server = SMTPServer()
+
+        async def run():
+            port = await server.start()
+            try:
+                with override_settings(
+                    EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                    EMAIL_HOST="127.0.0.1",
+                    EMAIL_PORT=port,
+                    **settings
+                ):
+                    return await coroutine_function()
+            finally:
+                await server.stop()
+
+        return server, asyncio.run(run())
+
+    def test_asend_smtp(self):
+        server, _ = self.run_with_server(
+            lambda: AsyncMail({"title": "foo"}).asend(["foo@example.com"])
+        )
+        self.assertEqual(len(server.messages), 1)
+        mail_from, rcpt_to, data = server.messages[0]
+        self.assertEqual(rcpt_to, ["<foo@example.com>"])
+        self.assertIn(b"Subject: [TestCase] Mail test subject", data)
+
+    def test_asend_many_smtp(self):
+        recipients = [
+            (["user%d@example.com" % i], {"title": "title %d" % i}) for i in range(20)
+        ]
+        server, results = self.run_with_server(
+            lambda: AsyncMail.asend_many(recipients),
+            MAIL_FACTORY_ASYNC_MAX_CONNECTIONS=3,
+        )
+        self.assertEqual(len(server.messages), 20)
+        self.assertEqual(results, [(emails, None) for emails, _ in recipients])
+        self.assertGreater(server.max_concurrent_connections, 1)
+        self.assertLessEqual(server.max_concurrent_connections, 3)
+
+    def test_asend_concurrent_smtp(self):
+        async def send_all():
+            mails = [AsyncMail({"title": str(i)}) for i in range(10)]
+            await asyncio.gather(*(m.asend(["foo@example.com"]) for m in mails))
+
+        server, _ = self.run_with_server(send_all, MAIL_FACTORY_ASYNC_MAX_CONNECTIONS=2)
+        self.assertEqual(len(server.messages), 10)
+        self.assertLessEqual(server.max_concurrent_connections, 2)
+
+    def test_semaphore_per_loop(self):
+        async def get_semaphore():
+            return aio.get_semaphore()
+
+        self.assertIsNot(asyncio.run(get_semaphore()), asyncio.run(get_semaphore()))
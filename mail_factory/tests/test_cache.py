@@ -0,0 +1,106 @@
+import mmap
+import os
+import tempfile
+from pathlib import Path
+
+from django.test import TestCase, override_settings
+from django.utils.autoreload import file_changed
+
+from .. import cache
+
+
+class LRUCacheTest(TestCase):
+    def setUp(self):
+        self.cache = cache.LRUCache("MAIL_FACTORY_TEST_CACHE_SIZE", 2)
+
+    def tearDown(self):
+        cache.caches.remove(self.cache)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("foo"))
+        self.assertEqual(self.cache.get("foo", "default"), "default")
+        self.assertEqual(self.cache.set("foo", "bar"), "bar")
+        self.assertEqual(self.cache.get("foo"), "bar")
+        self.assertIn("foo", self.cache)
+
+    def test_eviction(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")  # "b" is now the least recently used
+        self.cache.set("c", 3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertNotIn("b", self.cache)
+        self.assertIn("a", self.cache)
+        self.assertIn("c", self.cache)
+
+    def test_sizeof(self):
+        self.cache.sizeof = len
+        with override_settings(MAIL_FACTORY_TEST_CACHE_SIZE=10):
+            self.cache.set("a", b"12345")
+            self.cache.set("b", b"1234")
+            self.cache.set("too big", b"12345678901")  # never cached
+            self.assertNotIn("too big", self.cache)
+            self.assertEqual(len(self.cache), 2)
+            self.cache.set("c", b"123")
+            self.assertNotIn("a", self.cache)
+
+    @override_settings(MAIL_FACTORY_TEST_CACHE_SIZE=0)
+    def test_disabled(self):
+        self.cache.set("foo", "bar")
+        self.assertNotIn("foo", self.cache)
+
+    def test_clear(self):
+        self.cache.set("foo", "bar")
+        cache.clear_caches()
+        self.assertNotIn("foo", self.cache)
+
+    def test_file_changed(self):
+        self.cache.set("foo", "bar")
+        with override_settings(DEBUG=False):
+            file_changed.send(sender=None, file_path=Path("/tmp/body.html"))
+        self.assertIn("foo", self.cache)
+        with override_settings(DEBUG=True):
+            file_changed.send(sender=None, file_path=Path("/tmp/body.html"))
+        self.assertNotIn("foo", self.cache)
+
+
+class ReadAttachmentTest(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, b"content")
+        os.close(fd)
+
+    def tearDown(self):
+        cache.clear_caches()
+        os.remove(self.path)
+
+    def test_read_attachment(self):
+        content = cache.read_attachment(self.path)
+        self.assertEqual(content, b"content")
+        self.assertIs(cache.read_attachment(self.path), content)
+
+    def test_read_attachment_changed(self):
+        self.assertEqual(cache.read_attachment(self.path), b"content")
+        with open(self.path, "wb") as attachment:
+            attachment.write(b"new content")
+        self.assertEqual(cache.read_attachment(self.path), b"new content")
+
+    @override_settings(MAIL_FACTORY_ATTACHMENT_MMAP_SIZE=4)
+    def test_read_attachment_mmap(self):
+        content = cache.read_attachment(self.path)
+        self.assertIsInstance(content, mmap.mmap)
+        self.assertEqual(content[:], b"content")
+        self.assertIs(cache.read_attachment(self.path), content)
+        self.assertEqual(len(cache.attachment_cache), 0)
+
+    def test_get_data_url(self):
+        data_url = cache.get_data_url(self.path, "image/png")
+        self.assertEqual(data_url, "data:image/png;base64,Y29udGVudA==")
+        self.assertIs(cache.get_data_url(self.path, "image/png"), data_url)
+
+        with open(self.path, "wb") as attachment:
+            attachment.write(b"new content")
+        self.assertEqual(
+            cache.get_data_url(self.path, "image/png"),
+            "data:image/png;base64,bmV3IGNvbnRlbnQ=",
+        )
@@ -0,0 +1,84 @@
+from django.core import mail
+from django.db import connections
+from django.test import TestCase, override_settings
+
+from .. import factory
+from ..campaign import SerializedMessage, _init_worker, render_campaign
+from ..exceptions import MailFactoryError, MissingMailContextParamException
+from ..mails import BaseMail
+
+
+class CampaignMail(BaseMail):
+    params = ["title"]
+    template_name = "test"
+
+
+class SerializedMessageTest(TestCase):
+    def test_from_message(self):
+        message = CampaignMail({"title": "foo"}).create_email_msg(
+            ["foo@example.com"], from_email="bar@example.com"
+        )
+        serialized = SerializedMessage.from_message(message)
+        self.assertEqual(serialized.from_email, "bar@example.com")
+        self.assertEqual(serialized.recipients(), ["foo@example.com"])
+        self.assertIn(b"\r\nSubject: ", serialized.message().as_bytes(linesep="\r\n"))
+        self.assertNotIn(b"\r\n", serialized.message().as_bytes())
+
+
+@override_settings(MAIL_FACTORY_CAMPAIGN_CHUNK_SIZE=2)
+class CampaignTest(TestCase):
+    def setUp(self):
+        factory.register(CampaignMail)
+
+    def tearDown(self):
+        factory.unregister(CampaignMail)
+
+    def test_render_campaign(self):
+        recipients = [(["user%d@example.com" % i], {"title": i}) for i in range(5)]
+        recipients.insert(2, (["missing@example.com"], {}))
+        results = list(render_campaign("test", iter(recipients), processes=2))
+
+        self.assertEqual([emails for emails, _ in results], [e for e, _ in recipients])
+        self.assertIsInstance(results[2][1], MissingMailContextParamException)
+        self.assertIsInstance(results[3][1], SerializedMessage)
+        self.assertIn(b"user2@example.com", results[3][1].message().as_bytes())
+
+    def test_mail_campaign(self):
+        before = len(mail.outbox)
+        results = factory.mail_campaign(
+            "test",
+            [
+                (["foo@example.com"], {"title": "foo"}),
+                (["bar@example.com"], {}),  # missing param
+                (["baz@example.com"], {"title": "baz"}),
+            ],
+            processes=2,
+        )
+        self.assertEqual(len(mail.outbox), before + 2)
+        self.assertEqual(mail.outbox[-1].recipients(), ["baz@example.com"])
+        self.assertEqual(results[0], (["foo@example.com"], None))
+        self.assertIsInstance(results[1][1], MissingMailContextParamException)
+        self.assertEqual(results[2], (["baz@example.com"], None))
+
+    def test_mail_campaign_unregistered(self):
+        with self.assertRaises(MailFactoryError):
+            factory.mail_campaign("unknown", [])
+
+    def test_init_worker(self):
+        built = []
+        build_template_index = factory.build_template_index
+        factory.build_template_index = built.append
+        connections.all = lambda: []  # keep the test database connection
+        try:
+            _init_worker("test")
+        finally:
+            factory.build_template_index = build_template_index
+            del connections.all
+        self.assertEqual(built, [["test"]])
+
+    def test_init_worker_unregistered(self):
+        connections.all = lambda: []
+        try:
+            _init_worker("unknown")  # doesn't break the pool
+        finally:
+            del connections.all
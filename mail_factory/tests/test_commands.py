@@ -0,0 +1,234 @@
+import csv
+import json
+import shutil
+import tempfile
+from io import StringIO
+from os import makedirs
+from os.path import isfile, join
+
+from django.conf import settings
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from .. import factory
+from ..mails import BaseMail
+from ..management.commands.mailfactory_build_text import HEADER
+
+
+class BuildTextMail(BaseMail):
+    template_name = "build_text"
+    params = ["title"]
+
+
+class BuildTextCommandTest(TestCase):
+    def setUp(self):
+        self.templates_dir = tempfile.mkdtemp()
+        self.templates = [dict(settings.TEMPLATES[0], DIRS=[self.templates_dir])]
+        self.mail_dir = join(self.templates_dir, "mails", "build_text")
+        makedirs(join(self.mail_dir, "fr"))
+        self.write("subject.txt", "Subject")
+        self.write(
+            "body.html",
+            '{% load i18n %}<h1>{{ title }}</h1><p>{% trans "Hello" %} &amp; '
+            '<a href="{{ url }}">welcome</a></p>',
+        )
+        self.write(join("fr", "body.html"), "<h1>{{ title }}</h1><p>Bonjour</p>")
+        factory.register(BuildTextMail)
+
+        self.settings_override = override_settings(TEMPLATES=self.templates)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        factory.unregister(BuildTextMail)
+        shutil.rmtree(self.templates_dir)
+
+    def write(self, path, content):
+        with open(join(self.mail_dir, path), "w") as template:
+            template.write(content)
+
+    def read(self, path):
+        with open(join(self.mail_dir, path)) as template:
+            return template.read()
+
+    def test_build_text(self):
+        call_command("mailfactory_build_text", stdout=StringIO())
+        self.assertTrue(self.read("body.txt").startswith(HEADER))
+        self.assertIn("[welcome]({{ url }})", self.read("body.txt"))
+        self.assertIn('{% trans "Hello" %}', self.read("body.txt"))
+        self.assertIn("Bonjour", self.read(join("fr", "body.txt")))
+
+        # Reload the templates
+        with override_settings(TEMPLATES=list(self.templates)):
+            mail = BuildTextMail({"title": "<Title>", "url": "http://example.com"})
+            self.assertTrue(mail.has_part("body.txt", "en"))
+            msg = mail.create_email_msg([], lang="en")
+            self.assertEqual(
+                msg.body, "# <Title>\n\nHello & [welcome](http://example.com)"
+            )
+            msg = mail.create_email_msg([], lang="fr")
+            self.assertEqual(msg.body, "# <Title>\n\nBonjour")
+
+    def test_check(self):
+        with self.assertRaises(CommandError):
+            call_command("mailfactory_build_text", check=True)
+        self.assertFalse(isfile(join(self.mail_dir, "body.txt")))
+
+        call_command("mailfactory_build_text", stdout=StringIO())
+        call_command("mailfactory_build_text", check=True)
+
+        self.write("body.html", "<p>Updated</p>")
+        with self.assertRaises(CommandError):
+            call_command("mailfactory_build_text", check=True)
+
+    def test_keep_text_written_by_hand(self):
+        self.write(join("fr", "body.txt"), "Bonjour")
+        call_command("mailfactory_build_text", stdout=StringIO())
+        self.assertEqual(self.read(join("fr", "body.txt")), "Bonjour")
+        self.assertTrue(isfile(join(self.mail_dir, "body.txt")))
+
+
+class SendMail(BaseMail):
+    template_name = "test"
+    params = ["title"]
+
+
+class OptionalTitleMail(SendMail):
+    def get_params(self):
+        return []
+
+
+class SendCommandTest(TestCase):
+    def setUp(self):
+        self.input_dir = tempfile.mkdtemp()
+        factory.register(SendMail)
+
+    def tearDown(self):
+        factory.unregister(SendMail)
+        shutil.rmtree(self.input_dir)
+
+    def write(self, name, content):
+        path = join(self.input_dir, name)
+        with open(path, "w") as input_file:
+            input_file.write(content)
+        return path
+
+    def call(self, *args, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("mailfactory_send", *args, stdout=stdout, stderr=stderr, **options)
+        results = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        return results, stderr.getvalue()
+
+    def test_send_jsonl(self):
+        path = self.write(
+            "recipients.jsonl",
+            '{"emails": "foo@example.com", "title": "foo"}\n'
+            '{"emails": ["bar@example.com", "baz@example.com"], "title": "bar"}\n'
+            "\n"
+            '{"emails": "missing@example.com"}\n'
+            "not json\n"
+            '{"emails": "qux@example.com", "title": "qux"}\n',
+        )
+        before = len(mail.outbox)
+        results, report = self.call("test", input=path, batch_size=2, concurrency=2)
+
+        self.assertEqual(len(mail.outbox), before + 3)
+        self.assertEqual(
+            mail.outbox[before + 1].to, ["bar@example.com", "baz@example.com"]
+        )
+        self.assertEqual([result["row"] for result in results], [1, 2, 3, 4, 5])
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["sent", "sent", "failed", "failed", "sent"],
+        )
+        self.assertEqual(results[2]["error"], "'title'")
+        self.assertEqual(results[4]["emails"], ["qux@example.com"])
+        self.assertIn("5 rows, 3 sent, 2 failed", report)
+
+    def test_dry_run_csv(self):
+        path = self.write(
+            "recipients.csv",
+            'emails,title\nfoo@example.com,foo\n"bar@example.com, baz@example.com",bar\n',
+        )
+        log = join(self.input_dir, "results.jsonl")
+        before = len(mail.outbox)
+        results, report = self.call("test", input=path, log=log, dry_run=True)
+
+        self.assertEqual(len(mail.outbox), before)
+        self.assertEqual(results, [])
+        with open(log) as log_file:
+            results = [json.loads(line) for line in log_file]
+        self.assertEqual(
+            results,
+            [
+                {"row": 1, "emails": ["foo@example.com"], "status": "rendered"},
+                {
+                    "row": 2,
+                    "emails": ["bar@example.com", "baz@example.com"],
+                    "status": "rendered",
+                },
+            ],
+        )
+        self.assertIn("2 rows, 2 rendered, 0 failed", report)
+
+    def test_send_malformed_csv(self):
+        path = self.write(
+            "recipients.csv",
+            "emails,title\nfoo@example.com,%s\nbar@example.com,bar\n" % ("x" * 100),
+        )
+        field_size_limit = csv.field_size_limit(50)
+        try:
+            results, report = self.call("test", input=path)
+        finally:
+            csv.field_size_limit(field_size_limit)
+
+        self.assertEqual([result["status"] for result in results], ["failed", "sent"])
+        self.assertIn("field larger than field limit", results[0]["error"])
+        self.assertIn("2 rows, 1 sent, 1 failed", report)
+
+    def test_get_params(self):
+        path = self.write("recipients.jsonl", '{"emails": "foo@example.com"}\n')
+        factory.unregister(SendMail)
+        factory.register(OptionalTitleMail)
+        try:
+            results, report = self.call("test", input=path)
+        finally:
+            factory.unregister(OptionalTitleMail)
+            factory.register(SendMail)
+        self.assertEqual(results[0]["status"], "sent")
+
+    def test_unknown_mail(self):
+        path = self.write("recipients.jsonl", "")
+        with self.assertRaises(CommandError):
+            self.call("unknown", input=path)
+        with self.assertRaises(CommandError):
+            self.call("test", input=join(self.input_dir, "missing.jsonl"))
+
+
+class ManifestCommandTest(TestCase):
+    def setUp(self):
+        self.manifest_dir = tempfile.mkdtemp()
+        self.path = join(self.manifest_dir, "manifest.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.manifest_dir)
+
+    def test_manifest(self):
+        with self.assertRaises(CommandError):
+            call_command("mailfactory_manifest")
+        with self.assertRaises(CommandError):
+            call_command("mailfactory_manifest", output=self.path, check=True)
+
+        call_command("mailfactory_manifest", output=self.path, stdout=StringIO())
+        with open(self.path) as manifest:
+            manifest = json.load(manifest)
+        self.assertEqual(manifest["custom_form"], {"module": "demo.demo_app.mails"})
+
+        with override_settings(MAIL_FACTORY_MANIFEST=self.path):
+            call_command("mailfactory_manifest", check=True)
+        with open(self.path, "w") as manifest:
+            manifest.write("{}")
+        with self.assertRaises(CommandError):
+            call_command("mailfactory_manifest", output=self.path, check=True)
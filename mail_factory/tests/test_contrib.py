@@ -12,6 +12,7 @@ from django.urls import re_path, reverse
 from mail_factory import factory
 from mail_factory.contrib.auth.mails import PasswordResetMail
 from mail_factory.contrib.auth.views import PasswordResetView, password_reset
+from mail_factory.dispatch import dispatcher
 
 urlpatterns = [
     re_path(r"^reset/$", password_reset, name="reset"),
@@ -31,6 +32,11 @@ urlpatterns = [
         PasswordResetDoneView.as_view(),
         name="password_reset_done",
     ),
+    re_path(
+        r"^reset_async/$",
+        PasswordResetView.as_view(mail_async=True),
+        name="reset_async",
+    ),
     re_path(r"^admin/", admin.site.urls),
 ]
 
@@ -78,3 +84,16 @@ class ContribTestCase(TestCase):
         self.assertEqual(len(mail.outbox), 1)
         email = mail.outbox[0]
         self.assertEqual(email.subject, "Password reset on example.com")
+
+    def test_password_reset_async(self):
+        user = User.objects.create_user(
+            username="user", email="admin@example.com", password="password"
+        )
+
+        response = self.client.post(reverse("reset_async"), data={"email": user.email})
+        self.assertRedirects(response, reverse("password_reset_done"))
+
+        dispatcher.shutdown()  # wait for the mail to be sent
+        self.assertEqual(len(mail.outbox), 1)
+        email = mail.outbox[0]
+        self.assertEqual(email.subject, "Password reset on example.com")
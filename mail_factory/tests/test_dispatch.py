@@ -0,0 +1,146 @@
+import smtplib
+import threading
+from concurrent.futures import Future
+
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+
+from .. import factory
+from ..dispatch import Dispatcher, dispatcher
+from ..exceptions import MailFactoryError, MissingMailContextParamException
+from ..mails import BaseMail
+from ..messages import EmailMultiRelated
+
+
+class DispatchMail(BaseMail):
+    params = ["title"]
+    template_name = "test"
+
+
+class CountingBackend(locmem.EmailBackend):
+    """Count the connections opened, fail if asked to."""
+
+    opened = 0
+    closed = 0
+    disconnect = False
+
+    def open(self):
+        CountingBackend.opened += 1
+
+    def close(self):
+        CountingBackend.closed += 1
+
+    def send_messages(self, messages):
+        if CountingBackend.disconnect:
+            CountingBackend.disconnect = False
+            raise smtplib.SMTPServerDisconnected()
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND="mail_factory.tests.test_dispatch.CountingBackend",
+    MAIL_FACTORY_DISPATCH_WORKERS=1,
+)
+class DispatcherTest(TestCase):
+    def setUp(self):
+        CountingBackend.opened = CountingBackend.closed = 0
+        self.dispatcher = Dispatcher()
+
+    def tearDown(self):
+        self.dispatcher.shutdown()
+
+    def message(self, to="foo@example.com"):
+        return EmailMultiRelated("Subject", "Body", to=[to])
+
+    def test_send(self):
+        before = len(mail.outbox)
+        future = self.dispatcher.send(self.message())
+        self.assertIsInstance(future, Future)
+        self.assertEqual(future.result(), 1)
+        self.assertEqual(len(mail.outbox), before + 1)
+
+    def test_connection_reuse(self):
+        futures = [self.dispatcher.send(self.message()) for _ in range(3)]
+        self.assertEqual([future.result() for future in futures], [1, 1, 1])
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(CountingBackend.closed, 0)
+        self.dispatcher.shutdown()
+        self.assertEqual(CountingBackend.closed, 1)
+
+    def test_reconnect(self):
+        self.dispatcher.send(self.message()).result()
+        CountingBackend.disconnect = True
+        self.assertEqual(self.dispatcher.send(self.message()).result(), 1)
+        self.assertEqual(CountingBackend.opened, 2)
+
+    @override_settings(
+        MAIL_FACTORY_DISPATCH_QUEUE_SIZE=1, MAIL_FACTORY_DISPATCH_BLOCK=False
+    )
+    def test_queue_full(self):
+        sending = threading.Event()
+        release = threading.Event()
+
+        class SlowMessage(EmailMultiRelated):
+            def message(self):
+                sending.set()
+                release.wait()
+                return super().message()
+
+        first = self.dispatcher.send(SlowMessage("Subject", "Body", to=["a@b.c"]))
+        sending.wait()  # the only worker is busy
+        second = self.dispatcher.send(self.message())  # queued
+        with self.assertRaises(MailFactoryError):
+            self.dispatcher.send(self.message())
+        release.set()
+        self.assertEqual(first.result(), 1)
+        self.assertEqual(second.result(), 1)
+        # There is room again
+        self.assertEqual(self.dispatcher.send(self.message()).result(), 1)
+
+    def test_log_error(self):
+        class BrokenMessage(EmailMultiRelated):
+            def message(self):
+                raise ValueError("Broken")
+
+        message = BrokenMessage("Subject", "Body", to=["foo@example.com"])
+        message.template_name = "test"
+        with self.assertLogs("mail_factory", "ERROR") as logs:
+            future = self.dispatcher.send(message)
+            self.dispatcher.shutdown()  # The callbacks have run.
+        with self.assertRaises(ValueError):
+            future.result()
+        [record] = logs.records
+        self.assertEqual(
+            record.getMessage(), "Couldn't send the test mail to foo@example.com"
+        )
+        self.assertIsInstance(record.exc_info[1], ValueError)
+
+    def test_shutdown_drain(self):
+        before = len(mail.outbox)
+        for _ in range(5):
+            self.dispatcher.send(self.message())
+        self.dispatcher.shutdown()
+        self.assertEqual(len(mail.outbox), before + 5)
+        # The dispatcher can be used again
+        self.assertEqual(self.dispatcher.send(self.message()).result(), 1)
+
+
+class MailAsyncTest(TestCase):
+    def setUp(self):
+        factory.register(DispatchMail)
+
+    def tearDown(self):
+        factory.unregister(DispatchMail)
+        dispatcher.shutdown()
+
+    def test_mail_async(self):
+        before = len(mail.outbox)
+        future = factory.mail_async("test", ["foo@example.com"], {"title": "foo"})
+        self.assertEqual(future.result(), 1)
+        self.assertEqual(len(mail.outbox), before + 1)
+        self.assertEqual(mail.outbox[-1].to, ["foo@example.com"])
+
+    def test_mail_async_missing_param(self):
+        with self.assertRaises(MissingMailContextParamException):
+            factory.mail_async("test", ["foo@example.com"], {})
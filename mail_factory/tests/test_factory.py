@@ -1,14 +1,22 @@
 """Keep in mind throughout those tests that the mails from demo.demo_app.mails
 are automatically registered, and serve as fixture."""
 
+import base64
+import json
+import sys
+import tempfile
+from os.path import join
 
 from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core import mail
 from django.test import TestCase
 
 from .. import factory
+from ..cache import clear_caches
 from ..exceptions import MailFactoryError
 from ..forms import MailForm
-from ..mails import BaseMail
+from ..mails import BaseMail, template_index
 
 
 class RegistrationTest(TestCase):
@@ -63,6 +71,106 @@ class RegistrationTest(TestCase):
         with self.assertRaises(MailFactoryError):
             factory.unregister(TestMail)
 
+    def test_catalog(self):
+        class FooMail(BaseMail):
+            template_name = "foo"
+            params = ["title"]
+
+        factory.register(FooMail)
+        entry = factory.catalog["foo"]
+        self.assertEqual(entry["class_name"], "FooMail")
+        self.assertTrue(entry["class_path"].endswith("<locals>.FooMail"))
+        self.assertEqual(entry["params"], ["title"])
+        self.assertIsNone(entry["parts"])
+        self.assertIn("foo", factory._catalog_names)
+
+        factory.unregister(FooMail)
+        self.assertNotIn("foo", factory.catalog)
+        self.assertNotIn("foo", factory._catalog_names)
+
+    def test_catalog_follows_registry(self):
+        class FooMail(BaseMail):
+            template_name = "foo"
+
+        factory.register(FooMail)
+        self.assertIn("foo", factory.catalog)
+        del factory._registry["foo"]  # Bypassing unregister.
+        names = [entry["template_name"] for entry in factory.get_catalog()]
+        self.assertNotIn("foo", names)
+        self.assertNotIn("foo", factory.catalog)
+
+        factory._registry["foo"] = FooMail  # Bypassing register.
+        names = [entry["template_name"] for entry in factory.get_catalog()]
+        self.assertIn("foo", names)
+        self.assertEqual(names, sorted(factory._registry))
+
+    def test_get_catalog(self):
+        entries = factory.get_catalog()
+        names = [entry["template_name"] for entry in entries]
+        self.assertEqual(names, sorted(factory._registry))
+
+        clear_caches()
+        factory.index_templates("custom_form")
+        factory.index_templates("no_custom")
+        # The template caches of the sends aren't used.
+        key = ("mails/custom_form/en/subject.txt", "mails/custom_form/subject.txt")
+        self.assertIsNone(template_index.get(key))
+        entry = factory.catalog["custom_form"]
+        self.assertEqual(entry["parts"], ["subject.txt", "body.txt", "body.html"])
+        self.assertEqual(entry["languages"], ["en", "fr"])
+        self.assertEqual(factory.catalog["no_custom"]["parts"][-1], "body.txt")
+
+    def test_get_catalog_query(self):
+        entries = factory.get_catalog("CUSTOM form")
+        self.assertEqual([entry["template_name"] for entry in entries], ["custom_form"])
+        self.assertEqual(factory.get_catalog("demo_app.mails nothing"), [])
+
+
+class LazyRegistryTest(TestCase):
+    module = "mail_factory.tests.lazy_mails"
+
+    def setUp(self):
+        self.manifest_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.manifest_dir.cleanup()
+        factory._manifest.clear()
+        if "lazy" in factory._registry:
+            factory.unregister(factory._registry["lazy"])
+        sys.modules.pop(self.module, None)
+
+    def load_manifest(self, manifest):
+        path = join(self.manifest_dir.name, "manifest.json")
+        with open(path, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        factory.load_manifest(path)
+
+    def test_get_manifest(self):
+        manifest = factory.get_manifest()
+        self.assertEqual(manifest["no_custom"], {"module": "demo.demo_app.mails"})
+
+    def test_load_manifest(self):
+        self.load_manifest({"lazy": {"module": self.module}})
+        self.assertNotIn(self.module, sys.modules)
+        self.assertNotIn("lazy", factory._registry)
+
+        self.assertEqual(factory.get_mail_form("lazy").__name__, "LazyMailForm")
+        self.assertIn(self.module, sys.modules)
+        self.assertEqual(factory.get_mail_class("lazy").__name__, "LazyMail")
+        self.assertNotIn("lazy", factory._manifest)
+
+    def test_load_all(self):
+        self.load_manifest({"lazy": {"module": self.module}})
+        factory.load_all()
+        self.assertIn("lazy", factory._registry)
+
+    def test_outdated_manifest(self):
+        self.load_manifest({"gone": {"module": self.module}})
+        with self.assertRaises(MailFactoryError):
+            factory.get_mail_class("gone")
+        with self.assertRaises(MailFactoryError):
+            factory.get_mail_class("gone")
+
 
 class FactoryTest(TestCase):
     def setUp(self):
@@ -83,6 +191,49 @@ class FactoryTest(TestCase):
     def test_factory_get_mail_class(self):
         self.assertEqual(factory.get_mail_class("test"), self.test_mail)
 
+    def test_build_template_index(self):
+        clear_caches()
+        factory.build_template_index()
+        self.assertIs(
+            template_index.get(("mails/test/fr/body.html", "mails/test/body.html")),
+            True,
+        )
+        self.assertIs(
+            template_index.get(("mails/test/en/body.html", "mails/test/body.html")),
+            True,
+        )
+        self.assertIs(
+            template_index.get(
+                ("mails/no_custom/fr/body.html", "mails/no_custom/body.html")
+            ),
+            False,
+        )
+
+    def test_build_template_index_needs_context(self):
+        class ContextMail(BaseMail):
+            template_name = "context"
+            params = ["site"]
+
+            def get_template_part(self, part, lang=None):
+                return [self.context["site"] + part]
+
+        class LaterMail(BaseMail):
+            template_name = "later"
+
+        factory.register(ContextMail)
+        factory.register(LaterMail)
+        clear_caches()
+        try:
+            factory.build_template_index()  # ContextMail is skipped
+        finally:
+            factory.unregister(ContextMail)
+            factory.unregister(LaterMail)
+        # The mails registered after ContextMail are indexed.
+        self.assertIs(
+            template_index.get(("mails/later/en/body.html", "mails/later/body.html")),
+            False,
+        )
+
     def test_factory_get_mail_object(self):
         self.assertTrue(
             isinstance(
@@ -102,6 +253,26 @@ class FactoryTest(TestCase):
         message = factory.get_html_for("test", {"title": "Et hop"})
         self.assertIn("Et hop", message)
 
+    def test_cid_to_data(self):
+        image = finders.find("admin/img/search.svg")
+        with open(image, "rb") as image_file:
+            data = base64.b64encode(image_file.read()).decode()
+        html = factory.cid_to_data(
+            '<img src="cid:search.svg"><img src="cid:search.svg.png">'
+            '<a href="cid:base.css">search.svg</a>',
+            [
+                (image, "search.svg", "image/svg+xml"),
+                (image, "search.svg.png", "image/png"),
+                (finders.find("admin/css/base.css"), "base.css", "text/css"),
+            ],
+        )
+        self.assertEqual(
+            html,
+            '<img src="data:image/svg+xml;base64,%s">'
+            '<img src="data:image/png;base64,%s">'
+            '<a href="cid:base.css">search.svg</a>' % (data, data),
+        )
+
     def test_text_for(self):
         """Get the text body of the mail."""
         message = factory.get_text_for("test", {"title": "Et hop"})
@@ -121,6 +292,22 @@ class FactoryTest(TestCase):
         self.assertEqual(message.from_email, settings.DEFAULT_FROM_EMAIL)
         self.assertIn("Et hop", str(message.message()))
 
+    def test_mail_many(self):
+        before = len(mail.outbox)
+        results = factory.mail_many(
+            "test",
+            [
+                (["foo@example.com"], {"title": "foo"}),
+                (["bar@example.com"], {"title": "bar"}),
+            ],
+        )
+        self.assertEqual(
+            results, [(["foo@example.com"], None), (["bar@example.com"], None)]
+        )
+        self.assertEqual(len(mail.outbox), before + 2)
+        self.assertIn("foo", mail.outbox[-2].body)
+        self.assertIn("bar", mail.outbox[-1].body)
+
 
 class FactoryMailTest(TestCase):
     def setUp(self):
@@ -0,0 +1,48 @@
+import json
+import subprocess
+import sys
+
+from django.test import SimpleTestCase
+
+import mail_factory
+
+IMPORT_SCRIPT = """
+import json, sys
+from mail_factory import factory
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+class PackageImportTest(SimpleTestCase):
+    def import_package(self):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT],
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        return json.loads(output)
+
+    def test_lazy_imports(self):
+        modules = self.import_package()
+        for module in (
+            "pkg_resources",
+            "html2text",
+            "django.forms",
+            "mail_factory.mails",
+            "mail_factory.forms",
+        ):
+            self.assertNotIn(module, modules)
+
+    def test_lazy_attributes(self):
+        from mail_factory.forms import MailForm
+        from mail_factory.mails import BaseMail
+
+        self.assertIs(mail_factory.BaseMail, BaseMail)
+        self.assertIs(mail_factory.MailForm, MailForm)
+        self.assertIs(mail_factory.MailFactory.mail_form, MailForm)
+        self.assertIs(mail_factory.factory.mail_form, MailForm)
+        self.assertIsInstance(mail_factory.factory, mail_factory.MailFactory)
+        self.assertTrue(mail_factory.__version__)
+        self.assertIn("BaseMail", dir(mail_factory))
+        with self.assertRaises(AttributeError):
+            mail_factory.unknown
@@ -1,14 +1,21 @@
 """Keep in mind throughout those tests that the mails from demo.demo_app.mails
 are automatically registered, and serve as fixture."""
 
+import copy
+import pickle
+
+import html2text
 
 from django.conf import settings
 from django.contrib.staticfiles import finders
 from django.core import mail
+from django.core.mail.backends import locmem
 from django.template import TemplateDoesNotExist
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import translation
 
+from .. import mails
+from ..cache import MappedFile, clear_caches
 from ..exceptions import MissingMailContextParamException
 from ..mails import BaseMail
 
@@ -110,6 +117,73 @@ class MailTest(TestCase):
             "[TestCase] Mail test subject",
         )
 
+    def test_render_part_template_cache(self):
+        class TestMail(BaseMail):
+            params = []
+            template_name = "test"
+
+        old_select_template = mails.select_template
+        selected = []
+
+        def mock_select_template(templates):
+            selected.append(templates)
+            return old_select_template(templates)
+
+        mails.template_cache.clear()
+        mails.select_template = mock_select_template
+        try:
+            test_mail = TestMail()
+            test_mail._render_part("body.txt", "fr")
+            test_mail._render_part("body.txt", "fr")
+            TestMail()._render_part("body.txt", "fr")
+            self.assertEqual(len(selected), 1)
+            # Each language and part is resolved on its own
+            self.assertIn(
+                "Mail test body txt", test_mail._render_part("body.txt", "en")
+            )
+            test_mail._render_part("subject.txt", "fr")
+            self.assertEqual(len(selected), 3)
+        finally:
+            mails.select_template = old_select_template
+
+    def test_has_part(self):
+        class TestMail(BaseMail):
+            params = []
+            template_name = "test_no_txt"
+
+        test_mail = TestMail()
+        self.assertTrue(test_mail.has_part("body.html", "fr"))
+        self.assertFalse(test_mail.has_part("body.txt", "fr"))
+        self.assertFalse(test_mail.has_part("body.txt", "en"))
+
+    def test_missing_part_lookup_once(self):
+        class TestMail(BaseMail):
+            params = []
+            template_name = "test_no_txt"
+
+        old_select_template = mails.select_template
+        selected = []
+
+        def mock_select_template(templates):
+            selected.append(templates)
+            return old_select_template(templates)
+
+        clear_caches()
+        mails.select_template = mock_select_template
+        try:
+            TestMail().create_email_msg([], lang="fr")
+            TestMail().create_email_msg([], lang="fr")
+            with self.assertRaises(TemplateDoesNotExist):
+                TestMail()._render_part("body.txt", "fr")
+        finally:
+            mails.select_template = old_select_template
+        # subject.txt, body.txt and body.html, looked up once each
+        self.assertEqual(len(selected), 3)
+        self.assertIn(
+            ("mails/test_no_txt/fr/body.txt", "mails/test_no_txt/body.txt"),
+            mails.template_index,
+        )
+
     def test_create_email_msg(self):
         class TestMail(BaseMail):
             params = []
@@ -163,6 +237,38 @@ class MailTest(TestCase):
                 lang="fr",
             )
 
+    def test_html_to_text(self):
+        class TestMail(BaseMail):
+            params = []
+
+        class LinkMail(BaseMail):
+            params = []
+            html2text_options = {"ignore_links": True}
+
+        old_html2text = html2text.HTML2Text
+        converted = []
+
+        def mock_html2text():
+            converted.append(True)
+            return old_html2text()
+
+        html = '<p><a href="http://example.com">Link</a></p>'
+        clear_caches()
+        html2text.HTML2Text = mock_html2text
+        try:
+            self.assertEqual(
+                TestMail().html_to_text(html), "[Link](http://example.com)\n\n"
+            )
+            self.assertEqual(
+                TestMail().html_to_text(html), "[Link](http://example.com)\n\n"
+            )
+            self.assertEqual(len(converted), 1)
+            # Other options, other conversion
+            self.assertEqual(LinkMail().html_to_text(html), "Link\n\n")
+            self.assertEqual(len(converted), 2)
+        finally:
+            html2text.HTML2Text = old_html2text
+
     def test_create_email_msg_attachments(self):
         class TestMail(BaseMail):
             params = []
@@ -177,6 +283,43 @@ class MailTest(TestCase):
         self.assertEqual(len(msg.attachments), 1)  # base.css
         self.assertEqual(len(msg.related_attachments), 1)  # nav-bg.gif
 
+    @override_settings(MAIL_FACTORY_ATTACHMENT_MMAP_SIZE=1)
+    def test_create_email_msg_mapped_attachments(self):
+        class TestMail(BaseMail):
+            params = []
+            template_name = "test"
+
+        attachments = [
+            (finders.find("admin/img/nav-bg.gif"), "nav-bg.gif", "image/png"),
+            (finders.find("admin/css/base.css"), "base.css", "text/css"),
+        ]
+        msg = TestMail().create_email_msg([], attachments=attachments)
+        filename, content, mimetype = msg.attachments[0]
+        self.assertIsInstance(content, str)  # decoded text attachment
+        self.assertIn("nav-bg.gif", msg.message().as_string())
+        clear_caches()
+
+    @override_settings(MAIL_FACTORY_ATTACHMENT_MMAP_SIZE=1)
+    def test_pickle_mapped_attachments(self):
+        class PickledMail(BaseMail):
+            params = []
+            template_name = "test"
+
+        attachments = [
+            (finders.find("admin/img/nav-bg.gif"), "nav-bg.gif", "image/png"),
+            (finders.find("admin/img/search.svg"), "search.svg", "application/svg"),
+        ]
+        msg = PickledMail().create_email_msg([], attachments=attachments)
+        self.assertIsInstance(msg.attachments[0][1], MappedFile)
+        try:
+            for copied in [pickle.loads(pickle.dumps(msg)), copy.deepcopy(msg)]:
+                self.assertIsInstance(copied.attachments[0][1], bytes)
+                self.assertIsInstance(copied.related_attachments[0][1], bytes)
+                self.assertEqual(copied.attachments[0][1], msg.attachments[0][1][:])
+                self.assertEqual(copied.message().as_bytes().count(b"Content-ID"), 1)
+        finally:
+            clear_caches()
+
     def test_send(self):
         class TestMail(BaseMail):
             params = []
@@ -187,6 +330,93 @@ class MailTest(TestCase):
         self.assertEqual(len(mail.outbox), before + 1)
         self.assertEqual(mail.outbox[-1].to, ["foo@bar.com"])
 
+    def test_send_connection(self):
+        class TestMail(BaseMail):
+            params = []
+            template_name = "test"
+
+        class RecordingBackend(locmem.EmailBackend):
+            def send_messages(self, messages):
+                self.sent = messages
+                return super().send_messages(messages)
+
+        connection = RecordingBackend()
+        TestMail().send(["foo@bar.com"], connection=connection)
+        self.assertEqual(connection.sent[0].to, ["foo@bar.com"])
+
+    def test_send_connection_closed(self):
+        class TestMail(BaseMail):
+            params = []
+            template_name = "test"
+
+        class ConnectedBackend(locmem.EmailBackend):
+            connected = False
+
+            def open(self):
+                if self.connected:
+                    return False
+                self.connected = True
+                return True
+
+            def close(self):
+                self.connected = False
+
+        # Opened for the mail, closed afterwards.
+        connection = ConnectedBackend()
+        TestMail().send(["foo@bar.com"], connection=connection)
+        self.assertFalse(connection.connected)
+
+        # Already open: left open for the caller.
+        connection.open()
+        TestMail().send(["foo@bar.com"], connection=connection)
+        self.assertTrue(connection.connected)
+
+    def test_send_many(self):
+        class TestMail(BaseMail):
+            params = ["title"]
+            template_name = "test"
+
+        before = len(mail.outbox)
+        results = TestMail.send_many(
+            [
+                (["foo@bar.com"], {"title": "foo"}),
+                (["bar@bar.com"], {}),  # missing param
+                (["baz@bar.com"], {"title": "baz"}),
+            ]
+        )
+        self.assertEqual(len(mail.outbox), before + 2)
+        self.assertEqual(mail.outbox[-2].to, ["foo@bar.com"])
+        self.assertEqual(mail.outbox[-1].to, ["baz@bar.com"])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], (["foo@bar.com"], None))
+        self.assertEqual(results[1][0], ["bar@bar.com"])
+        self.assertIsInstance(results[1][1], MissingMailContextParamException)
+        self.assertEqual(results[2], (["baz@bar.com"], None))
+
+    def test_send_many_single_connection(self):
+        class TestMail(BaseMail):
+            params = []
+            template_name = "test"
+
+        class CountingBackend(locmem.EmailBackend):
+            opened = 0
+            closed = 0
+
+            def open(self):
+                CountingBackend.opened += 1
+
+            def close(self):
+                CountingBackend.closed += 1
+
+        connection = CountingBackend()
+        TestMail.send_many([(["foo@bar.com"], {}), (["bar@bar.com"], {})])
+        TestMail.send_many(
+            [(["foo@bar.com"], {}), (["bar@bar.com"], {})], connection=connection
+        )
+        self.assertEqual(CountingBackend.opened, 1)
+        # A given connection is left open.
+        self.assertEqual(CountingBackend.closed, 0)
+
     def test_mail_admins(self):
         class TestMail(BaseMail):
             params = []
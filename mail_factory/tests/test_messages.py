@@ -4,7 +4,7 @@ are automatically registered, and serve as fixture."""
 
 from os.path import basename
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from .. import messages
 
@@ -47,6 +47,39 @@ class EmailMultiRelatedTest(TestCase):
             self.message.alternatives, [('<img src="cid:img.gif" />', "text/html")]
         )
 
+    def test_create_alternatives_many(self):
+        self.message.alternatives = [
+            (
+                '<img src="a.gif" /><img src="cid:b.gif" /><img src="ba.gif" />'
+                '<a href="a.gif">a.gif</a>',
+                "text/html",
+            ),
+            ("a.gif", "text/plain"),
+        ]
+        self.message.related_attachments = [
+            ("a.gif", b"", "image/gif"),
+            ("b.gif", b"", "image/gif"),
+            ("ba.gif", b"", "image/gif"),
+        ]
+        self.message._create_alternatives(None)
+        self.assertEqual(
+            self.message.alternatives,
+            [
+                (
+                    '<img src="cid:a.gif" /><img src="cid:b.gif" />'
+                    '<img src="cid:ba.gif" />'
+                    '<a href="cid:a.gif">cid:a.gif</a>',
+                    "text/html",
+                ),
+                ("a.gif", "text/plain"),
+            ],
+        )
+
+    def test_get_filenames_pattern(self):
+        regex = messages.get_filenames_pattern(["a.gif", "a.gif.png"])
+        self.assertEqual(regex.findall("a.gif a.gif.png a_gif"), ["a.gif", "a.gif.png"])
+        self.assertIs(messages.get_filenames_pattern(["a.gif.png", "a.gif"]), regex)
+
     def test_create_related_attachments(self):
         self.message.related_attachments = [("img.gif", b"", "image/gif")]
         self.message.body = True
@@ -54,3 +87,35 @@ class EmailMultiRelatedTest(TestCase):
         content, attachment = new_msg.get_payload()
         self.assertEqual(content, "foo message")
         self.assertEqual(attachment.get_filename(), "img.gif")
+
+    def test_create_related_attachment(self):
+        first = self.message._create_related_attachment("img.gif", b"GIF", "image/gif")
+        second = self.message._create_related_attachment("img.gif", b"GIF", "image/gif")
+        self.assertIsNot(first, second)
+        self.assertEqual(first["Content-ID"], "<img.gif>")
+        self.assertEqual(first.get_payload(decode=True), b"GIF")
+
+    @override_settings(MAIL_FACTORY_RELATED_PART_CACHE_SIZE=10)
+    def test_create_related_attachment_cache(self):
+        first = self.message._create_related_attachment("img.gif", b"GIF", "image/gif")
+        second = messages.EmailMultiRelated()._create_related_attachment(
+            "img.gif", b"GIF", "image/gif"
+        )
+        self.assertIs(first, second)
+        # Another content, another part
+        other = self.message._create_related_attachment("img.gif", b"GIF2", "image/gif")
+        self.assertIsNot(first, other)
+        self.assertEqual(other.get_payload(decode=True), b"GIF2")
+        messages.related_part_cache.clear()
+
+    @override_settings(MAIL_FACTORY_RELATED_PART_CACHE_SIZE=10)
+    def test_message_shared_related_attachment(self):
+        for to in ["foo@example.com", "bar@example.com"]:
+            message = messages.EmailMultiRelated("Subject", "Body", to=[to])
+            message.attach_alternative('<img src="img.gif" />', "text/html")
+            message.attach_related("img.gif", b"GIF", "image/gif")
+            content = message.message().as_bytes()
+            self.assertIn(b"Content-ID: <img.gif>", content)
+            self.assertIn(to.encode(), content)
+        self.assertEqual(len(messages.related_part_cache), 1)
+        messages.related_part_cache.clear()
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import factory, metrics, signals
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.metrics.clear()
+        signals.phase_finished.connect(metrics.phase_finished_handler)
+
+    def tearDown(self):
+        signals.phase_finished.disconnect(metrics.phase_finished_handler)
+        metrics.metrics.clear()
+
+    def test_send(self):
+        context = {"title": "Title", "content": "Content"}
+        factory.mail("custom_form", ["foo@example.com"], context)
+
+        text = metrics.render()
+        self.assertIn('mail_factory_sent_total{template="custom_form"} 1\n', text)
+        self.assertIn(
+            'mail_factory_render_seconds_count{template="custom_form"} 3\n', text
+        )
+        self.assertIn('mail_factory_message_recipients_bucket{le="1"} 1\n', text)
+        self.assertIn("mail_factory_message_recipients_sum 1\n", text)
+        self.assertIn("mail_factory_message_size_bytes_count 1\n", text)
+
+    def test_failure(self):
+        metrics.phase_finished_handler(
+            None, "send", 0.1, "custom_form", error=OSError("Broken")
+        )
+        text = metrics.render()
+        self.assertIn(
+            'mail_factory_send_failures_total{template="custom_form"} 1\n', text
+        )
+        self.assertNotIn("mail_factory_sent_total{", text)
+
+    def test_render(self):
+        metrics.metrics.observe("mail_factory_message_recipients", 3)
+        metrics.metrics.observe("mail_factory_message_recipients", 1000)
+        metrics.metrics.inc("mail_factory_sent_total", ('a "quoted"\\name',), 2)
+        text = metrics.render()
+        self.assertIn("# TYPE mail_factory_message_recipients histogram\n", text)
+        self.assertIn(
+            "\n".join(
+                [
+                    'mail_factory_message_recipients_bucket{le="1"} 0',
+                    'mail_factory_message_recipients_bucket{le="2"} 0',
+                    'mail_factory_message_recipients_bucket{le="5"} 1',
+                    'mail_factory_message_recipients_bucket{le="10"} 1',
+                    'mail_factory_message_recipients_bucket{le="25"} 1',
+                    'mail_factory_message_recipients_bucket{le="50"} 1',
+                    'mail_factory_message_recipients_bucket{le="100"} 1',
+                    'mail_factory_message_recipients_bucket{le="+Inf"} 2',
+                    "mail_factory_message_recipients_sum 1003",
+                    "mail_factory_message_recipients_count 2",
+                ]
+            ),
+            text,
+        )
+        self.assertIn(
+            'mail_factory_sent_total{template="a \\"quoted\\"\\\\name"} 2\n', text
+        )
+
+    def test_multiprocess(self):
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            other = {
+                "counters": [["mail_factory_sent_total", ["welcome"], 2]],
+                "histograms": [
+                    ["mail_factory_message_recipients", [], [1, 0, 0, 0, 0, 0, 0, 0], 1]
+                ],
+            }
+            with open(os.path.join(metrics_dir, "1.json"), "w") as fd:
+                json.dump(other, fd)
+
+            metrics.metrics.inc("mail_factory_sent_total", ("welcome",))
+            metrics.metrics.observe("mail_factory_message_recipients", 1)
+            with override_settings(MAIL_FACTORY_METRICS_DIR=metrics_dir):
+                text = metrics.render()
+                self.assertIn("%d.json" % os.getpid(), os.listdir(metrics_dir))
+
+        self.assertIn('mail_factory_sent_total{template="welcome"} 3\n', text)
+        self.assertIn("mail_factory_message_recipients_count 2\n", text)
+
+    @override_settings(MAIL_FACTORY_METRICS_FLUSH_INTERVAL=0)
+    def test_flush_error(self):
+        with tempfile.NamedTemporaryFile() as not_a_dir:
+            metrics_dir = os.path.join(not_a_dir.name, "metrics")
+            with override_settings(MAIL_FACTORY_METRICS_DIR=metrics_dir):
+                with self.assertLogs("mail_factory", "ERROR"):
+                    metrics.metrics.inc("mail_factory_sent_total", ("welcome",))
+                with self.assertLogs("mail_factory", "ERROR"):
+                    text = metrics.render()
+        self.assertIn('mail_factory_sent_total{template="welcome"} 1\n', text)
+
+    def test_flush_temporary_file(self):
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            with override_settings(MAIL_FACTORY_METRICS_DIR=metrics_dir):
+                metrics.metrics.flush()
+                metrics.metrics.flush()
+            self.assertEqual(os.listdir(metrics_dir), ["%d.json" % os.getpid()])
+
+
+class MetricsViewTest(TestCase):
+    def test_get(self):
+        url = reverse("mail_factory_metrics")
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertContains(response, "# TYPE mail_factory_sent_total counter")
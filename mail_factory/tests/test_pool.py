@@ -0,0 +1,183 @@
+import smtplib
+
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+
+from .. import factory
+from ..mails import BaseMail
+from ..pool import ConnectionPool, get_connection_key, is_alive, pool
+
+
+class PoolMail(BaseMail):
+    params = ["title"]
+    template_name = "test"
+
+
+class NoopSMTP(smtplib.SMTP):
+    """An SMTP client answering NOOP without any server."""
+
+    def noop(self):
+        if not PoolBackend.alive:
+            raise smtplib.SMTPServerDisconnected()
+        return 250, b"OK"
+
+
+class PoolBackend(locmem.EmailBackend):
+    """Count the connections, fail if asked to."""
+
+    opened = 0
+    closed = 0
+    alive = True
+    disconnect = False
+    refuse = False
+    connection = None
+
+    def open(self):
+        if self.connection is not None:
+            return False
+        PoolBackend.opened += 1
+        self.connection = NoopSMTP()
+        return True
+
+    def close(self):
+        PoolBackend.closed += 1
+        self.connection = None
+
+    def send_messages(self, messages):
+        if PoolBackend.disconnect:
+            PoolBackend.disconnect = False
+            raise smtplib.SMTPServerDisconnected()
+        if PoolBackend.refuse:
+            PoolBackend.refuse = False
+            raise smtplib.SMTPRecipientsRefused({})
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND="mail_factory.tests.test_pool.PoolBackend",
+    MAIL_FACTORY_CONNECTION_POOL_SIZE=1,
+)
+class ConnectionPoolTest(TestCase):
+    def setUp(self):
+        PoolBackend.opened = PoolBackend.closed = 0
+        PoolBackend.alive = True
+        PoolBackend.disconnect = PoolBackend.refuse = False
+        factory.register(PoolMail)
+
+    def tearDown(self):
+        factory.unregister(PoolMail)
+        pool.clear()
+
+    def send(self, count=1):
+        for i in range(count):
+            PoolMail({"title": str(i)}).send(["foo@example.com"])
+
+    def test_disabled(self):
+        with override_settings(MAIL_FACTORY_CONNECTION_POOL_SIZE=0):
+            before = len(mail.outbox)
+            self.send(2)
+            self.assertEqual(len(mail.outbox), before + 2)
+            with pool.connection():
+                pass
+            self.assertEqual(PoolBackend.opened, PoolBackend.closed)
+
+    def test_reuse(self):
+        before = len(mail.outbox)
+        self.send(3)
+        factory.mail_admins("test", {"title": "admins"})
+        factory.mail_many("test", [(["bar@example.com"], {"title": "bar"})])
+        self.assertEqual(len(mail.outbox), before + 5)
+        self.assertEqual(PoolBackend.opened, 1)
+        self.assertEqual(PoolBackend.closed, 0)
+
+        pool.clear()
+        self.assertEqual(PoolBackend.closed, 1)
+
+    def test_max_size(self):
+        with pool.connection() as first, pool.connection() as second:
+            self.assertIsNot(first, second)
+        self.assertEqual(PoolBackend.opened, 2)
+        self.assertEqual(PoolBackend.closed, 1)  # Only one idle connection kept.
+
+    @override_settings(MAIL_FACTORY_CONNECTION_IDLE_TIMEOUT=0)
+    def test_idle_timeout(self):
+        self.send(2)
+        self.assertEqual(PoolBackend.opened, 2)
+        self.assertEqual(PoolBackend.closed, 1)
+
+    @override_settings(MAIL_FACTORY_CONNECTION_KEEPALIVE=0)
+    def test_keepalive(self):
+        self.send()
+        self.send()
+        self.assertEqual(PoolBackend.opened, 1)
+
+        PoolBackend.alive = False
+        self.send()
+        self.assertEqual(PoolBackend.opened, 2)
+        self.assertEqual(PoolBackend.closed, 1)
+
+    def test_reconnect(self):
+        self.send()
+        PoolBackend.disconnect = True
+        before = len(mail.outbox)
+        self.send()
+        self.assertEqual(len(mail.outbox), before + 1)
+        self.assertEqual(PoolBackend.opened, 2)
+
+    def test_mail_many_reconnect(self):
+        self.send()
+        PoolBackend.disconnect = True
+        results = factory.mail_many(
+            "test",
+            [
+                (["foo@example.com"], {"title": "foo"}),
+                (["bar@example.com"], {"title": "bar"}),
+            ],
+        )
+        self.assertEqual(
+            results, [(["foo@example.com"], None), (["bar@example.com"], None)]
+        )
+        self.assertEqual(PoolBackend.opened, 2)
+        self.send()  # The new connection was given back to the pool.
+        self.assertEqual(PoolBackend.opened, 2)
+
+    def test_mail_many_failure(self):
+        self.send()
+        PoolBackend.refuse = True
+        results = factory.mail_many(
+            "test",
+            [
+                (["foo@example.com"], {"title": "foo"}),
+                (["bar@example.com"], {"title": "bar"}),
+            ],
+        )
+        self.assertIsInstance(results[0][1], smtplib.SMTPRecipientsRefused)
+        self.assertEqual(results[1], (["bar@example.com"], None))
+        self.assertEqual(PoolBackend.closed, 1)  # Not given back to the pool.
+        self.send()
+        self.assertEqual(PoolBackend.opened, 2)
+
+    @override_settings(EMAIL_TIMEOUT=10)
+    def test_connection_key(self):
+        key = get_connection_key()
+        with override_settings(EMAIL_TIMEOUT=20):
+            self.assertNotEqual(get_connection_key(), key)
+        with override_settings(EMAIL_SSL_CERTFILE="cert.pem"):
+            self.assertNotEqual(get_connection_key(), key)
+        with override_settings(EMAIL_SSL_KEYFILE="key.pem"):
+            self.assertNotEqual(get_connection_key(), key)
+
+    def test_is_alive(self):
+        with pool.connection() as connection:
+            self.assertTrue(is_alive(connection))
+            PoolBackend.alive = False
+            self.assertFalse(is_alive(connection))
+        self.assertTrue(is_alive(locmem.EmailBackend()))
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            with pool.connection():
+                raise ValueError()
+        self.assertEqual(PoolBackend.closed, 1)  # Not given back to the pool.
+        self.assertEqual(ConnectionPool().size, 1)
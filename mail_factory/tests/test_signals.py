@@ -0,0 +1,94 @@
+from django.core.mail.backends import locmem
+from django.test import TestCase
+
+from .. import factory, signals
+from ..campaign import SerializedMessage
+from ..messages import EmailMultiRelated
+
+
+class PhaseFinishedTest(TestCase):
+    def setUp(self):
+        self.reports = []
+        signals.phase_finished.connect(self.receiver)
+
+    def tearDown(self):
+        signals.phase_finished.disconnect(self.receiver)
+
+    def receiver(self, sender, **kwargs):
+        self.reports.append(dict(kwargs, sender=sender))
+
+    def get_reports(self, phase):
+        return [report for report in self.reports if report["phase"] == phase]
+
+    def test_no_receivers(self):
+        signals.phase_finished.disconnect(self.receiver)
+        self.assertIsNone(signals.start())
+        signals.finish(None, "render", None)  # Not measured, not sent.
+        self.assertEqual(self.reports, [])
+
+    def test_send_phases(self):
+        context = {"title": "Title", "content": "Content"}
+        factory.mail("custom_form", ["foo@example.com"], context)
+
+        phases = [report["phase"] for report in self.reports]
+        for phase in ["context", "render", "attachments", "mime", "send"]:
+            self.assertIn(phase, phases)
+        for report in self.reports:
+            self.assertEqual(report["template_name"], "custom_form")
+            self.assertGreaterEqual(report["duration"], 0)
+
+        renders = self.get_reports("render")
+        self.assertEqual(
+            [report["part"] for report in renders],
+            ["subject.txt", "body.txt", "body.html"],
+        )
+        self.assertTrue(all(report["size"] > 0 for report in renders))
+        self.assertIsNone(renders[0]["recipients"])
+
+        [send] = self.get_reports("send")
+        self.assertIs(send["sender"], locmem.EmailBackend)
+        self.assertEqual(send["recipients"], 1)
+        self.assertGreater(send["size"], 0)
+        self.assertIs(self.get_reports("mime")[0]["sender"], EmailMultiRelated)
+
+    def test_receiver_error(self):
+        def broken_receiver(sender, **kwargs):
+            raise ValueError("Broken")
+
+        signals.phase_finished.connect(broken_receiver)
+        try:
+            with self.assertLogs("mail_factory", "ERROR") as logs:
+                results = factory.mail_many(
+                    "custom_form",
+                    [
+                        (["foo@example.com"], {"title": "foo", "content": ""}),
+                        (["bar@example.com"], {"title": "bar", "content": ""}),
+                    ],
+                )
+        finally:
+            signals.phase_finished.disconnect(broken_receiver)
+        # The mails were sent anyway.
+        self.assertEqual([error for emails, error in results], [None, None])
+        self.assertEqual(len(self.get_reports("send")), 2)
+        self.assertIsInstance(logs.records[0].exc_info[1], ValueError)
+
+    def test_html2text_phase(self):
+        mail = factory.get_mail_object("custom_form", {"title": "", "content": ""})
+        mail.html_to_text("<p>Hé</p>")
+        [report] = self.get_reports("html2text")
+        self.assertEqual(report["template_name"], "custom_form")
+        self.assertEqual(report["size"], len("Hé\n\n".encode("utf-8")))
+
+
+class MessageSizeTest(TestCase):
+    def test_get_message_size(self):
+        message = EmailMultiRelated("Subject", "Body", to=["foo@example.com"])
+        message.attach_alternative("<p>Hé</p>", "text/html")
+        message.attach("file.txt", b"12345", "text/plain")
+        message.attach_related("image.png", b"123", "image/png")
+        self.assertEqual(signals.get_attachments_size(message), 8)
+        self.assertEqual(signals.get_message_size(message), 4 + 10 + 8)
+
+    def test_get_message_size_serialized(self):
+        message = SerializedMessage("from@example.com", [], b"data")
+        self.assertEqual(signals.get_message_size(message), 4)
@@ -0,0 +1,155 @@
+import fcntl
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+from io import StringIO
+
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .. import factory, spool
+from ..exceptions import MailFactoryError
+from ..mails import BaseMail
+
+
+class SpoolMail(BaseMail):
+    params = ["title"]
+    template_name = "test"
+
+
+class FailingBackend(locmem.EmailBackend):
+    """Count the connections opened, refuse the messages."""
+
+    opened = 0
+
+    def open(self):
+        FailingBackend.opened += 1
+
+    def send_messages(self, messages):
+        raise OSError("Connection refused")
+
+
+class BrokenBackend(FailingBackend):
+    """Refuse the messages, and fail to quit."""
+
+    def close(self):
+        raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+
+class SpoolTest(TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MAIL_FACTORY_SPOOL_DIR=self.spool_dir
+        )
+        self.settings_override.enable()
+        factory.register(SpoolMail)
+
+    def tearDown(self):
+        factory.unregister(SpoolMail)
+        self.settings_override.disable()
+        shutil.rmtree(self.spool_dir)
+
+    def spooled(self, subdir=""):
+        path = os.path.join(self.spool_dir, subdir)
+        return sorted(name for name in os.listdir(path) if name.endswith(".json"))
+
+    def test_no_spool_dir(self):
+        with override_settings(MAIL_FACTORY_SPOOL_DIR=None):
+            with self.assertRaises(MailFactoryError):
+                factory.mail(
+                    "test", ["foo@example.com"], {"title": "foo"}, deferred=True
+                )
+
+    def test_deferred(self):
+        before = len(mail.outbox)
+        factory.mail("test", ["foo@example.com"], {"title": "foo"}, deferred=True)
+        self.assertEqual(len(mail.outbox), before)
+        self.assertEqual(len(self.spooled()), 1)
+        self.assertEqual(self.spooled("tmp"), [])
+
+        self.assertEqual(spool.process_spool(), (1, 0, 0))
+        self.assertEqual(len(mail.outbox), before + 1)
+        self.assertEqual(mail.outbox[-1].recipients(), ["foo@example.com"])
+        self.assertIn(
+            b"Subject: [TestCase] Mail test subject",
+            mail.outbox[-1].message().as_bytes(),
+        )
+        self.assertEqual(self.spooled(), [])
+
+    def test_no_fcntl(self):
+        SpoolMail({"title": "foo"}).send(["foo@example.com"], deferred=True)
+        fcntl_module, spool.fcntl = spool.fcntl, None
+        try:
+            with self.assertRaises(MailFactoryError):
+                spool.process_spool()
+        finally:
+            spool.fcntl = fcntl_module
+        self.assertEqual(len(self.spooled()), 1)
+
+    def test_limit(self):
+        for i in range(3):
+            SpoolMail({"title": i}).send(["foo@example.com"], deferred=True)
+        self.assertEqual(spool.process_spool(limit=2), (2, 0, 0))
+        self.assertEqual(len(self.spooled()), 1)
+
+    def test_locked(self):
+        path = spool.spool_message(
+            SpoolMail({"title": "foo"}).create_email_msg(["foo@example.com"])
+        )
+        with open(path) as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self.assertEqual(spool.process_spool(), (0, 0, 0))
+        self.assertEqual(spool.process_spool(), (1, 0, 0))
+
+    @override_settings(
+        EMAIL_BACKEND="mail_factory.tests.test_spool.FailingBackend",
+        MAIL_FACTORY_SPOOL_MAX_ATTEMPTS=2,
+        MAIL_FACTORY_SPOOL_RETRY_DELAY=0,
+    )
+    def test_retry(self):
+        FailingBackend.opened = 0
+        SpoolMail({"title": "foo"}).send(["foo@example.com"], deferred=True)
+        SpoolMail({"title": "bar"}).send(["bar@example.com"], deferred=True)
+
+        self.assertEqual(spool.process_spool(), (0, 2, 0))
+        self.assertEqual(FailingBackend.opened, 2)  # Reconnected after a failure.
+        name = self.spooled()[0]
+        with open(os.path.join(self.spool_dir, name)) as fd:
+            record = json.load(fd)
+        self.assertEqual(record["attempts"], 1)
+        self.assertIn("Connection refused", record["error"])
+
+        self.assertEqual(spool.process_spool(), (0, 0, 2))
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(len(self.spooled("failed")), 2)
+        self.assertIn(name, self.spooled("failed"))
+
+    @override_settings(EMAIL_BACKEND="mail_factory.tests.test_spool.BrokenBackend")
+    def test_retry_broken_connection(self):
+        SpoolMail({"title": "foo"}).send(["foo@example.com"], deferred=True)
+        SpoolMail({"title": "bar"}).send(["bar@example.com"], deferred=True)
+        self.assertEqual(spool.process_spool(), (0, 2, 0))
+
+    @override_settings(
+        EMAIL_BACKEND="mail_factory.tests.test_spool.FailingBackend",
+        MAIL_FACTORY_SPOOL_RETRY_DELAY=60,
+    )
+    def test_backoff(self):
+        SpoolMail({"title": "foo"}).send(["foo@example.com"], deferred=True)
+        self.assertEqual(spool.process_spool(), (0, 1, 0))
+        self.assertEqual(spool.process_spool(), (0, 0, 0))  # Not due yet.
+
+    def test_worker_command(self):
+        before = len(mail.outbox)
+        for i in range(3):
+            SpoolMail({"title": i}).send(["foo@example.com"], deferred=True)
+        stdout = StringIO()
+        call_command("mailfactory_worker", once=True, batch_size=2, stdout=stdout)
+        self.assertEqual(len(mail.outbox), before + 3)
+        self.assertEqual(self.spooled(), [])
+        self.assertIn("2 sent, 0 to retry, 0 failed", stdout.getvalue())
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from .. import factory, throttle
+from ..mails import BaseMail
+from ..throttle import DomainThrottle, Scheduler
+
+
+class ThrottleMail(BaseMail):
+    params = ["title"]
+    template_name = "test"
+
+
+class DomainThrottleTest(TestCase):
+    def test_get_domains(self):
+        self.assertEqual(
+            throttle.get_domains(["foo@Example.com", "Bar <bar@gmail.com>"]),
+            {"example.com", "gmail.com"},
+        )
+
+    def test_token_bucket(self):
+        domain = DomainThrottle(rate=2, burst=2)
+        now = domain.updated
+        self.assertEqual(domain.delay(now), 0)
+        domain.tokens -= 2
+        self.assertEqual(domain.delay(now), 0.5)
+        self.assertEqual(domain.delay(now + 0.5), 0)
+        self.assertEqual(domain.delay(now + 10), 0)
+        self.assertEqual(domain.tokens, 2)  # No more than the burst.
+
+    def test_max_connections(self):
+        domain = DomainThrottle(rate=100, max_connections=1)
+        domain.connections = 1
+        self.assertIsNone(domain.delay(domain.updated))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            DomainThrottle(rate=0)
+
+
+@override_settings(
+    MAIL_FACTORY_DOMAIN_THROTTLE={
+        "slow.com": {"rate": 20, "burst": 1, "max_connections": 1}
+    }
+)
+class SchedulerTest(TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler()
+
+    def test_disabled(self):
+        with override_settings(MAIL_FACTORY_DOMAIN_THROTTLE={}):
+            items = ["foo@slow.com", "bar@slow.com"]
+            self.assertEqual(list(self.scheduler.schedule(items, None)), items)
+
+    def test_acquire(self):
+        self.assertEqual(self.scheduler.acquire({"slow.com", "fast.com"}), 0)
+        self.assertIsNone(self.scheduler.acquire({"slow.com"}))  # No free slot.
+        self.assertEqual(self.scheduler.acquire({"fast.com"}), 0)
+        self.scheduler.release({"slow.com", "fast.com"})
+        self.assertGreater(self.scheduler.acquire({"slow.com"}), 0)  # No token.
+
+    def test_schedule(self):
+        items = ["1@slow.com", "2@slow.com", "3@fast.com", "4@fast.com", "5@slow.com"]
+        start = time.monotonic()
+        scheduled = list(
+            self.scheduler.schedule(items, lambda item: throttle.get_domains([item]))
+        )
+        # The other domains don't wait for the slow one.
+        self.assertEqual(
+            scheduled,
+            ["1@slow.com", "3@fast.com", "4@fast.com", "2@slow.com", "5@slow.com"],
+        )
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_aacquire(self):
+        async def acquire_twice():
+            await self.scheduler.aacquire({"slow.com"})
+            self.scheduler.release({"slow.com"})
+            start = time.monotonic()
+            await self.scheduler.aacquire({"slow.com"})
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(acquire_twice()), 0.04)
+
+
+@override_settings(MAIL_FACTORY_DOMAIN_THROTTLE={"slow.com": {"rate": 20, "burst": 1}})
+class ThrottledSendTest(TestCase):
+    def setUp(self):
+        factory.register(ThrottleMail)
+        throttle.scheduler.clear()
+
+    def tearDown(self):
+        factory.unregister(ThrottleMail)
+
+    def test_mail_many(self):
+        recipients = [
+            (["1@slow.com"], {"title": "1"}),
+            (["2@slow.com"], {"title": "2"}),
+            (["3@fast.com"], {}),  # missing param
+            (["4@fast.com"], {"title": "4"}),
+        ]
+        before = len(mail.outbox)
+        results = factory.mail_many("test", recipients)
+
+        sent = [message.to for message in mail.outbox[before:]]
+        self.assertEqual(sent, [["1@slow.com"], ["4@fast.com"], ["2@slow.com"]])
+        # The results are in the recipients order.
+        self.assertEqual([emails for emails, _ in results], [e for e, _ in recipients])
+        self.assertIsNone(results[1][1])
+        self.assertIsNotNone(results[2][1])
+
+    def test_amail_many(self):
+        recipients = [(["%d@slow.com" % i], {"title": str(i)}) for i in range(3)]
+        start = time.monotonic()
+        results = asyncio.run(factory.amail_many("test", recipients))
+        self.assertEqual(results, [(emails, None) for emails, _ in recipients])
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
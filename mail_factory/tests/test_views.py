@@ -1,22 +1,57 @@
 """Keep in mind throughout those tests that the mails from demo.demo_app.mails
 are automatically registered, and serve as fixture."""
 
+import threading
+import time
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.http import Http404, HttpResponse
-from django.test import TestCase
+from django.template import TemplateDoesNotExist
+from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
 from django.urls import reverse
+from django.utils import translation
 
 from .. import factory, views
 from ..forms import MailForm
+from ..mails import BaseMail
 
 
 class MailListViewTest(TestCase):
+    def get_context_data(self, **params):
+        view = views.MailListView()
+        view.setup(RequestFactory().get("/", params))
+        view.object_list = view.get_queryset()
+        return view.get_context_data()
+
     def test_get_context_data(self):
-        data = views.MailListView().get_context_data()
+        data = self.get_context_data()
         self.assertIn("mail_map", data)
         self.assertEqual(len(data["mail_map"]), len(factory._registry))
+        self.assertEqual(data["object_list"], factory.get_catalog())
+
+    def test_get_context_data_search(self):
+        data = self.get_context_data(q="no_custom")
+        self.assertEqual(data["query"], "no_custom")
+        self.assertEqual(data["mail_map"], [("no_custom", "NoCustomMail")])
+
+    @override_settings(MAIL_FACTORY_LIST_PAGINATE_BY=1)
+    def test_get_context_data_paginated(self):
+        for entry in factory.catalog.values():
+            entry["parts"] = entry["languages"] = None
+        data = self.get_context_data(page=2)
+        self.assertTrue(data["is_paginated"])
+        self.assertEqual(data["page_obj"].number, 2)
+        self.assertEqual(len(data["mail_map"]), 1)
+        self.assertEqual(data["paginator"].count, len(factory._registry))
+        # Only the mails of the page are indexed.
+        indexed = [
+            entry["template_name"]
+            for entry in factory.get_catalog()
+            if entry["parts"] is not None
+        ]
+        self.assertEqual(indexed, [data["mail_map"][0][0]])
 
 
 class TemplateTest(TestCase):
@@ -40,6 +75,20 @@ class TemplateTest(TestCase):
         response = self.client.get(reverse("mail_factory_list"))
         self.assertEqual(response.status_code, 200)
 
+    @override_settings(MAIL_FACTORY_LIST_PAGINATE_BY=1)
+    def test_get_mail_factory_list_search(self):
+        response = self.client.get(reverse("mail_factory_list"), {"q": "custom"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "CustomFormMail")
+        self.assertContains(response, "?q=custom&amp;page=2")
+
+    def test_get_mail_factory_form(self):
+        response = self.client.get(
+            reverse("mail_factory_form", kwargs={"mail_name": "custom_form"})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'class="timing"', count=2)
+
 
 class MailPreviewMixinTest(TestCase):
     def test_get_html_alternative(self):
@@ -83,6 +132,39 @@ class MailPreviewMixinTest(TestCase):
         view.mail_class = factory._registry["custom_form"]
         message = view.get_mail_preview("custom_form", "en")
         self.assertTrue(message.html)
+        self.assertEqual(message.html, view.get_html_alternative(message))
+
+    def test_get_mail_preview_renders_once(self):
+        view = views.MailFormView()
+        view.mail_name = "custom_form"
+        view.mail_class = factory._registry["custom_form"]
+
+        rendered = []
+        old_render_part = view.mail_class._render_part
+
+        def render_part(mail, part, lang=None):
+            rendered.append((part, lang))
+            return old_render_part(mail, part, lang=lang)
+
+        old_get_mail_form = factory.get_mail_form
+        forms = []
+
+        def get_mail_form(template_name):
+            forms.append(template_name)
+            return old_get_mail_form(template_name)
+
+        view.mail_class._render_part = render_part
+        factory.get_mail_form = get_mail_form
+        try:
+            view.get_mail_preview("custom_form", "en")
+            view.get_mail_preview("custom_form", "fr")
+        finally:
+            del view.mail_class._render_part  # Back to BaseMail._render_part.
+            factory.get_mail_form = old_get_mail_form
+
+        self.assertEqual(len(rendered), len(set(rendered)))
+        self.assertIn(("body.html", "fr"), rendered)
+        self.assertEqual(forms, ["custom_form"])  # The context is built once.
 
 
 class MailFormViewTest(TestCase):
@@ -203,6 +285,76 @@ class MailFormViewTest(TestCase):
         self.assertEqual(data["mail_name"], "no_custom")
         self.assertIn("preview_messages", data)
         self.assertDictEqual(data["preview_messages"], {"fr": "mocked", "en": "mocked"})
+        self.assertEqual(set(data["preview_timings"]), {"fr", "en"})
+
+    @override_settings(MAIL_FACTORY_PREVIEW_TIMEOUT=0.1)
+    def test_get_mail_previews(self):
+        view = views.MailFormView()
+        view.mail_name = "no_custom"
+        view.mail_class = factory._registry["no_custom"]
+
+        def get_mail_preview(view, template_name, lang):
+            if lang == "fr":
+                time.sleep(0.5)
+            return translation.get_language()
+
+        old_get_mail_preview = views.MailPreviewMixin.get_mail_preview
+        views.MailPreviewMixin.get_mail_preview = get_mail_preview
+        try:
+            previews = view.get_mail_previews()
+        finally:
+            views.MailPreviewMixin.get_mail_preview = old_get_mail_preview
+
+        self.assertEqual([preview["lang"] for preview in previews], ["en", "fr"])
+        self.assertEqual(previews[0]["message"], "en")  # Rendered in english.
+        self.assertGreaterEqual(previews[0]["timing"], 0)
+        self.assertIsNone(previews[1]["message"])
+        self.assertEqual(previews[1]["error"], "Timed out after 0.1 seconds")
+
+    @override_settings(MAIL_FACTORY_PREVIEW_TIMEOUT=0.1)
+    def test_get_mail_previews_deadline(self):
+        view = views.MailFormView()
+        view.mail_name = "no_custom"
+        view.mail_class = factory._registry["no_custom"]
+        release = threading.Event()
+
+        def get_mail_preview(view, template_name, lang):
+            release.wait()
+            return lang
+
+        old_get_mail_preview = views.MailPreviewMixin.get_mail_preview
+        views.MailPreviewMixin.get_mail_preview = get_mail_preview
+        try:
+            previews = view.get_mail_previews()
+        finally:
+            release.set()
+            views.MailPreviewMixin.get_mail_preview = old_get_mail_preview
+
+        # A single deadline for all the languages.
+        self.assertEqual(
+            [preview["error"] for preview in previews],
+            ["Timed out after 0.1 seconds"] * 2,
+        )
+
+    def test_get_mail_previews_error(self):
+        view = views.MailFormView()
+        view.mail_name = "no_custom"
+        view.mail_class = factory._registry["no_custom"]
+
+        def get_mail_preview(view, template_name, lang):
+            if lang == "fr":
+                raise TemplateDoesNotExist("broken.html")
+            return lang
+
+        old_get_mail_preview = views.MailPreviewMixin.get_mail_preview
+        views.MailPreviewMixin.get_mail_preview = get_mail_preview
+        try:
+            previews = view.get_mail_previews()
+        finally:
+            views.MailPreviewMixin.get_mail_preview = old_get_mail_preview
+
+        self.assertEqual(previews[0]["message"], "en")
+        self.assertEqual(previews[1]["error"], "TemplateDoesNotExist: broken.html")
 
 
 class MailPreviewMessageViewTest(TestCase):
@@ -243,3 +395,142 @@ class MailPreviewMessageViewTest(TestCase):
         self.assertIn("mail_name", data)
         self.assertEqual(data["mail_name"], "no_custom")
         self.assertIn("message", data)
+
+
+class ConditionalPreviewTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        credentials = {
+            "username": "admin",
+            "password": "admin",
+        }
+        User.objects.create_superuser(email="admin@example.com", **credentials)
+        self.client.login(**credentials)
+        self.url = reverse(
+            "mail_factory_preview_message",
+            kwargs={"mail_name": "custom_form", "lang": "fr"},
+        )
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+    def test_not_modified_form(self):
+        url = reverse("mail_factory_form", kwargs={"mail_name": "custom_form"})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        other = reverse(
+            "mail_factory_preview_message",
+            kwargs={"mail_name": "custom_form", "lang": "en"},
+        )
+        self.assertNotEqual(self.client.get(other)["ETag"], etag)
+
+        get_mtime = views.get_mtime
+        views.get_mtime = lambda path: 42  # A template was modified.
+        try:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        finally:
+            views.get_mtime = get_mtime
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_cached_content(self):
+        content = self.client.get(self.url).content
+
+        get_mail_preview = views.MailPreviewMixin.get_mail_preview
+
+        def mock_get_mail_preview(*args, **kwargs):
+            raise AssertionError("The preview should be cached")
+
+        views.MailPreviewMixin.get_mail_preview = mock_get_mail_preview
+        try:
+            response = self.client.get(self.url)
+        finally:
+            views.MailPreviewMixin.get_mail_preview = get_mail_preview
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, content)
+
+    def test_etag_default_repr(self):
+        get_preview_context = views.MailPreviewMixin.get_preview_context
+
+        def mock_get_preview_context(view):
+            # Not used by the templates, with a new repr each time.
+            return dict(get_preview_context(view), unused=object())
+
+        views.MailPreviewMixin.get_preview_context = mock_get_preview_context
+        try:
+            etag = self.client.get(self.url)["ETag"]
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        finally:
+            views.MailPreviewMixin.get_preview_context = get_preview_context
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_without_rendering(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        render_part = BaseMail._render_part
+
+        def mock_render_part(*args, **kwargs):
+            raise AssertionError("The ETag shouldn't render the mail")
+
+        BaseMail._render_part = mock_render_part
+        try:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        finally:
+            BaseMail._render_part = render_part
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_context(self):
+        etag = self.client.get(self.url)["ETag"]
+        get_preview_context = views.MailPreviewMixin.get_preview_context
+
+        def mock_get_preview_context(view):
+            return dict(get_preview_context(view), title="Another title")
+
+        views.MailPreviewMixin.get_preview_context = mock_get_preview_context
+        try:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        finally:
+            views.MailPreviewMixin.get_preview_context = get_preview_context
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_cached_headers(self):
+        render_to_response = views.MailPreviewMessageView.render_to_response
+
+        def mock_render_to_response(view, context, **kwargs):
+            kwargs["content_type"] = "text/plain; charset=utf-8"
+            response = render_to_response(view, context, **kwargs)
+            response["X-Preview"] = "yes"
+            return response
+
+        views.MailPreviewMessageView.render_to_response = mock_render_to_response
+        try:
+            self.client.get(self.url)
+        finally:
+            views.MailPreviewMessageView.render_to_response = render_to_response
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertEqual(response["X-Preview"], "yes")
+
+    @override_settings(MAIL_FACTORY_PREVIEW_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        response = self.client.get(self.url)
+        key = "mail_factory.preview.%s" % response["ETag"].strip('"')
+        self.assertIsNone(cache.get(key))
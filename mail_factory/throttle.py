@@ -0,0 +1,196 @@
+"""Throttle the bulk sending by recipient domain.
+
+The rates are configured by domain in the MAIL_FACTORY_DOMAIN_THROTTLE
+setting, the ``"*"`` key applying to each of the other domains::
+
+    MAIL_FACTORY_DOMAIN_THROTTLE = {
+        "gmail.com": {"rate": 20, "burst": 50, "max_connections": 2},
+        "*": {"rate": 100},
+    }
+
+``rate`` is the number of messages per second, ``burst`` the number of
+messages which may be sent at once after an idle period (the rate by
+default), and ``max_connections`` the number of messages sent to the domain
+at the same time (unlimited by default).
+
+The limits are shared by all the bulk sends of the process.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from email.utils import parseaddr
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+def get_domains(addresses):
+    """Return the set of the domains of the addresses."""
+    return frozenset(
+        parseaddr(address)[1].rpartition("@")[2].lower() for address in addresses
+    )
+
+
+class DomainThrottle:
+    """A token bucket and a concurrency limit for a domain."""
+
+    def __init__(self, rate, burst=None, max_connections=None):
+        if rate <= 0 or (max_connections is not None and max_connections < 1):
+            raise ValueError("The rate and max_connections must be positive")
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.max_connections = max_connections or math.inf
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.connections = 0
+
+    def delay(self, now):
+        """Return the seconds to wait for a token, None to wait for a slot."""
+        if self.connections >= self.max_connections:
+            return None
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0, (1 - self.tokens) / self.rate)
+
+
+class Scheduler:
+    """Schedule the messages according to the rates of their domains."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._throttles = {}
+        self._releases = 0
+
+    @property
+    def enabled(self):
+        return bool(getattr(settings, "MAIL_FACTORY_DOMAIN_THROTTLE", None))
+
+    def _get_throttle(self, domain):
+        if domain not in self._throttles:
+            rates = getattr(settings, "MAIL_FACTORY_DOMAIN_THROTTLE", None) or {}
+            config = rates.get(domain, rates.get("*"))
+            self._throttles[domain] = DomainThrottle(**config) if config else None
+        return self._throttles[domain]
+
+    def acquire(self, domains):
+        """Take a token and a slot of each domain if they are all available.
+
+        Return 0 on success, or the seconds to wait before trying again, None
+        if a slot must be released first.
+        """
+        with self._condition:
+            throttles = [self._get_throttle(domain) for domain in domains]
+            throttles = [throttle for throttle in throttles if throttle is not None]
+            now = time.monotonic()
+            delays = [throttle.delay(now) for throttle in throttles]
+            if None in delays:
+                return None
+            delay = max(delays, default=0)
+            if delay:
+                return delay
+            for throttle in throttles:
+                throttle.tokens -= 1
+                throttle.connections += 1
+            return 0
+
+    def release(self, domains):
+        """Release the slots of the domains taken by acquire."""
+        with self._condition:
+            for domain in domains:
+                throttle = self._throttles.get(domain)
+                if throttle is not None and throttle.connections:
+                    throttle.connections -= 1
+            self._releases += 1
+            self._condition.notify_all()
+
+    def _wait(self, delay, releases):
+        with self._condition:
+            if self._releases == releases:
+                self._condition.wait(delay)
+
+    async def aacquire(self, domains):
+        """Wait until acquire succeeds, without blocking the event loop."""
+        while True:
+            delay = self.acquire(domains)
+            if delay == 0:
+                return
+            await asyncio.sleep(0.01 if delay is None else delay)
+
+    def schedule(self, items, get_item_domains):
+        """Yield the items as soon as their domains allow it.
+
+        The items are grouped by domains: while the items of a throttled
+        domain wait, the items of the other domains are yielded, so the
+        items order isn't kept. Up to MAIL_FACTORY_THROTTLE_BUFFER_SIZE items
+        (1000 by default) wait at once.
+
+        The slots of an item domains are held until the next item is asked.
+        """
+        if not self.enabled:
+            yield from items
+            return
+
+        buffer_size = getattr(settings, "MAIL_FACTORY_THROTTLE_BUFFER_SIZE", 1000)
+        items = iter(items)
+        queues = OrderedDict()  # Waiting items, by domains.
+        buffered = 0
+        exhausted = False
+        while True:
+            releases = self._releases
+            ready = None
+            while ready is None and not exhausted and buffered < buffer_size:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                domains = get_item_domains(item)
+                if domains not in queues and self.acquire(domains) == 0:
+                    ready = item, domains
+                else:
+                    queues.setdefault(domains, deque()).append(item)
+                    buffered += 1
+
+            delay = None
+            if ready is None:
+                if not queues:
+                    return
+                for domains, queue in queues.items():
+                    wait = self.acquire(domains)
+                    if wait == 0:
+                        ready = queue.popleft(), domains
+                        buffered -= 1
+                        if not queue:
+                            del queues[domains]
+                        break
+                    if wait is not None and (delay is None or wait < delay):
+                        delay = wait
+
+            if ready is None:
+                self._wait(delay, releases)
+                continue
+            item, domains = ready
+            try:
+                yield item
+            finally:
+                self.release(domains)
+
+    def clear(self):
+        """Forget about the domains, eg: when the rates changed."""
+        with self._condition:
+            self._throttles.clear()
+
+
+#: The process-wide scheduler.
+scheduler = Scheduler()
+
+
+@receiver(setting_changed, dispatch_uid="mail_factory_throttle_setting_changed")
+def setting_changed_handler(sender, setting, **kwargs):
+    """Forget about the domains when their rates change."""
+    if setting == "MAIL_FACTORY_DOMAIN_THROTTLE":
+        scheduler.clear()
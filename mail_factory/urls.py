@@ -2,7 +2,13 @@
 from django.conf import settings
 from django.urls import re_path
 
-from mail_factory.views import form, html_not_found, mail_list, preview_message
+from mail_factory.views import (
+    form,
+    html_not_found,
+    mail_list,
+    metrics_view,
+    preview_message,
+)
 
 LANGUAGE_CODES = "|".join([code for code, name in settings.LANGUAGES])
 
@@ -20,4 +26,5 @@ urlpatterns = [
         html_not_found,
         name="mail_factory_html_not_found",
     ),
+    re_path(r"^metrics/$", metrics_view, name="mail_factory_metrics"),
 ]
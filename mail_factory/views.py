@@ -1,30 +1,78 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
+from django.core.cache import cache
+from django.db import close_old_connections
 from django.http import Http404, HttpResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import redirect
 from django.template import TemplateDoesNotExist
-from django.views.generic import FormView, TemplateView
+from django.template.loader import select_template
+from django.utils import translation
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.generic import FormView, ListView, TemplateView, View
 
-from . import exceptions, factory
+from . import exceptions, factory, metrics
 
 admin_required = user_passes_test(lambda x: x.is_superuser)
 
+#: The threads rendering the previews, see get_preview_executor.
+preview_executor = None
+preview_executor_lock = threading.Lock()
+
+
+def get_preview_executor():
+    """Return the threads rendering the previews of the languages.
+
+    The pool has MAIL_FACTORY_PREVIEW_WORKERS threads (4 by default), shared
+    by the requests.
+    """
+    global preview_executor
+    with preview_executor_lock:
+        if preview_executor is None:
+            preview_executor = ThreadPoolExecutor(
+                getattr(settings, "MAIL_FACTORY_PREVIEW_WORKERS", 4),
+                thread_name_prefix="mail_factory_preview",
+            )
+    return preview_executor
+
+
+class MailListView(ListView):
+    """Return a list of mails, from the factory catalog.
 
-class MailListView(TemplateView):
-    """Return a list of mails."""
+    The mails are searched with the ``q`` parameter, and paginated by
+    MAIL_FACTORY_LIST_PAGINATE_BY (100 by default).
+    """
 
     template_name = "mail_factory/list.html"
 
+    def get_paginate_by(self, queryset):
+        return getattr(settings, "MAIL_FACTORY_LIST_PAGINATE_BY", 100)
+
+    def get_queryset(self):
+        return factory.get_catalog(self.request.GET.get("q"))
+
     def get_context_data(self, **kwargs):
-        """Return object_list."""
+        """Return object_list, the catalog entries of the page.
+
+        Only the templates of the mails of the page are looked up.
+        """
         data = super().get_context_data(**kwargs)
-        mail_list = []
-        for mail_name, mail_class in sorted(
-            factory._registry.items(), key=lambda x: x[0]
-        ):
-            mail_list.append((mail_name, mail_class.__name__))
-        data["mail_map"] = mail_list
+        for entry in data["object_list"]:
+            if entry["parts"] is None:
+                factory.index_templates(entry["template_name"])
+        data["query"] = self.request.GET.get("q", "")
+        data["mail_map"] = [
+            (entry["template_name"], entry["class_name"])
+            for entry in data["object_list"]
+        ]
         return data
 
 
@@ -35,33 +83,140 @@ class MailPreviewMixin:
         if "text/html" in alternatives:
             return alternatives["text/html"]
 
-    def get_mail_preview(self, template_name, lang, cid_to_data=False):
-        """Return a preview from a mail's form's initial data."""
-        form_class = factory.get_mail_form(self.mail_name)
-        form = form_class(mail_class=self.mail_class)
+    def get_preview_context(self):
+        """Return the preview context, from the mail's form's initial data.
 
-        form = form_class(form.get_context_data(), mail_class=self.mail_class)
-        data = form.get_context_data()
-        if form.is_valid():
-            data.update(form.cleaned_data)
+        The context is built once and then reused for all the languages.
+        """
+        if getattr(self, "_preview_context", None) is None:
+            form_class = factory.get_mail_form(self.mail_name)
+            form = form_class(mail_class=self.mail_class)
+
+            form = form_class(form.get_context_data(), mail_class=self.mail_class)
+            data = form.get_context_data()
+            if form.is_valid():
+                data.update(form.cleaned_data)
 
-        # overwrite with preview data if any
-        data.update(form.get_preview_data())
+            # overwrite with preview data if any
+            data.update(form.get_preview_data())
+            self._preview_context = data
+        return self._preview_context
 
-        mail = self.mail_class(data)
+    def get_mail_preview(self, template_name, lang, cid_to_data=False):
+        """Return a preview from a mail's form's initial data.
+
+        Each part is only rendered once: the html preview is the html
+        alternative of the message.
+        """
+        mail = self.mail_class(dict(self.get_preview_context()))
         message = mail.create_email_msg([settings.ADMINS], lang=lang)
 
-        try:
-            message.html = factory.get_html_for(
-                self.mail_name, data, lang=lang, cid_to_data=True
-            )
-        except TemplateDoesNotExist:
+        html = self.get_html_alternative(message)
+        if html is None:
             message.html = False
+        else:
+            message.html = factory.cid_to_data(html, mail.get_attachments())
 
         return message
 
 
-class MailFormView(MailPreviewMixin, FormView):
+#: The memory address of the default object repr, see get_preview_etag.
+MEMORY_ADDRESS_RE = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def get_mtime(path):
+    """Return the modification time of the file, None if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+class ConditionalPreviewMixin:
+    """Answer the unchanged previews with a 304 Not Modified.
+
+    The ETag is a hash of get_etag_parts, and the rendered page is kept in
+    the Django cache for MAIL_FACTORY_PREVIEW_CACHE_TIMEOUT seconds (300 by
+    default, 0 to only use the ETag).
+    """
+
+    mail_parts = ("subject.txt", "body.txt", "body.html")
+
+    def get_preview_languages(self):
+        """Return the codes of the previewed languages."""
+        return [lang_code for lang_code, lang_name in settings.LANGUAGES]
+
+    def get_preview_etag(self, context):
+        """Return a stable representation of the preview context.
+
+        The values are compared through their repr, without the memory
+        address of the default object repr. Override it if the previews
+        depend on a state the repr doesn't show, eg: return the primary key
+        and modification time of a model instance.
+        """
+        return sorted(
+            (key, MEMORY_ADDRESS_RE.sub("", repr(value)))
+            for key, value in context.items()
+        )
+
+    def get_etag_parts(self):
+        """Return what the rendered page depends on, without rendering it.
+
+        That's the mail class, the languages, the preview context (see
+        get_preview_etag) and the modification times of the templates and
+        attachments.
+        """
+        context = self.get_preview_context()
+        mail = self.mail_class(dict(context))
+        paths = [select_template(self.get_template_names()).origin.name]
+        for lang in self.get_preview_languages():
+            for part in self.mail_parts:
+                template = mail._get_template(part, lang=lang)
+                if template is not None:
+                    paths.append(template.origin.name)
+        paths.extend(filepath for filepath, _, _ in mail.get_attachments())
+
+        return [
+            "%s.%s" % (self.mail_class.__module__, self.mail_class.__qualname__),
+            self.mail_name,
+            self.get_preview_languages(),
+            translation.get_language(),
+            self.get_preview_etag(context),
+            [(path, get_mtime(path)) for path in paths],
+        ]
+
+    def get_etag(self):
+        parts = repr(self.get_etag_parts()).encode("utf-8")
+        return '"%s"' % hashlib.sha1(parts).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            key = "mail_factory.preview.%s" % etag.strip('"')
+            cached = cache.get(key)
+            if cached is None:
+                response = super().get(request, *args, **kwargs)
+                response.render()
+                timeout = getattr(settings, "MAIL_FACTORY_PREVIEW_CACHE_TIMEOUT", 300)
+                if timeout and response.status_code == 200:
+                    cached = {
+                        "status": response.status_code,
+                        "headers": dict(response.items()),
+                        "content": response.content,
+                    }
+                    cache.set(key, cached, timeout)
+            else:
+                response = HttpResponse(cached["content"], status=cached["status"])
+                for header, value in cached["headers"].items():
+                    response[header] = value
+        response["ETag"] = etag
+        # Revalidated by the browser each time, the previews change often.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class MailFormView(ConditionalPreviewMixin, MailPreviewMixin, FormView):
     template_name = "mail_factory/form.html"
 
     def dispatch(self, request, mail_name):
@@ -78,6 +233,20 @@ class MailFormView(MailPreviewMixin, FormView):
 
         return super().dispatch(request)
 
+    def get(self, request, *args, **kwargs):
+        if messages.get_messages(request):
+            # Not cached, the messages are shown once.
+            return super(ConditionalPreviewMixin, self).get(request, *args, **kwargs)
+        return super().get(request, *args, **kwargs)
+
+    def get_etag_parts(self):
+        """The page also depends on the user and the CSRF token of the form."""
+        get_token(self.request)
+        return super().get_etag_parts() + [
+            self.request.user.pk,
+            self.request.META.get("CSRF_COOKIE"),
+        ]
+
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs["mail_class"] = self.mail_class
@@ -119,14 +288,62 @@ class MailFormView(MailPreviewMixin, FormView):
         data = super().get_context_data(**kwargs)
         data["mail_name"] = self.mail_name
 
-        preview_messages = {}
-        for lang_code, lang_name in settings.LANGUAGES:
-            message = self.get_mail_preview(self.mail_name, lang_code)
-            preview_messages[lang_code] = message
-        data["preview_messages"] = preview_messages
+        previews = self.get_mail_previews()
+        data["previews"] = previews
+        data["preview_messages"] = {
+            preview["lang"]: preview["message"] for preview in previews
+        }
+        data["preview_timings"] = {
+            preview["lang"]: preview["timing"] for preview in previews
+        }
 
         return data
 
+    def get_mail_previews(self):
+        """Render the preview of each language on the preview threads.
+
+        The languages not rendered after MAIL_FACTORY_PREVIEW_TIMEOUT seconds
+        (10 by default), for all of them, or failing don't prevent the other
+        previews. A running render can't be stopped: after the timeout, it
+        keeps its preview thread until it's done, and its result is dropped.
+
+        Return a list of dicts with the language code, the message (None if it
+        failed), the rendering time in milliseconds and the error if any.
+        """
+        timeout = getattr(settings, "MAIL_FACTORY_PREVIEW_TIMEOUT", 10)
+        self.get_preview_context()  # Built once, before the threads use it.
+        executor = get_preview_executor()
+        futures = [
+            (lang_code, executor.submit(self.render_preview, lang_code))
+            for lang_code, lang_name in settings.LANGUAGES
+        ]
+        done, not_done = wait([future for lang_code, future in futures], timeout)
+
+        previews = []
+        for lang_code, future in futures:
+            preview = {"lang": lang_code, "message": None, "timing": None}
+            if future in not_done:
+                future.cancel()  # Only if it's still waiting for a thread.
+                preview["error"] = "Timed out after %s seconds" % timeout
+            else:
+                try:
+                    preview["message"], preview["timing"] = future.result()
+                except Exception as e:
+                    preview["error"] = "%s: %s" % (e.__class__.__name__, e)
+            previews.append(preview)
+        return previews
+
+    def render_preview(self, lang_code):
+        """Return the preview message of the language and its rendering time."""
+        close_old_connections()
+        start = time.perf_counter()
+        try:
+            with translation.override(lang_code):
+                message = self.get_mail_preview(self.mail_name, lang_code)
+        finally:
+            close_old_connections()
+        return message, (time.perf_counter() - start) * 1000
+
 
 class HTMLNotFoundView(TemplateView):
     """No HTML template was found"""
@@ -134,7 +351,7 @@ class HTMLNotFoundView(TemplateView):
     template_name = "mail_factory/html_not_found.html"
 
 
-class MailPreviewMessageView(MailPreviewMixin, TemplateView):
+class MailPreviewMessageView(ConditionalPreviewMixin, MailPreviewMixin, TemplateView):
     template_name = "mail_factory/preview_message.html"
 
     def dispatch(self, request, mail_name, lang):
@@ -148,6 +365,9 @@ class MailPreviewMessageView(MailPreviewMixin, TemplateView):
 
         return super().dispatch(request)
 
+    def get_preview_languages(self):
+        return [self.lang]
+
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
         message = self.get_mail_preview(self.mail_name, self.lang)
@@ -156,7 +376,17 @@ class MailPreviewMessageView(MailPreviewMixin, TemplateView):
         return data
 
 
+class MetricsView(View):
+    """Return the metrics in the Prometheus text format."""
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+
 mail_list = admin_required(MailListView.as_view())
 form = admin_required(MailFormView.as_view())
 html_not_found = admin_required(HTMLNotFoundView.as_view())
 preview_message = admin_required(MailPreviewMessageView.as_view())
+metrics_view = admin_required(MetricsView.as_view())